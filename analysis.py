@@ -1,24 +1,1852 @@
+import time
+_MODULE_T0 = time.time()  # 启动耗时基准的起点
 import numpy as np
 import pandas as pd
-import os, sys
+import io, os, re, sys, glob, json, inspect, argparse, hashlib, shutil, threading, tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from typing import Dict
-from sklearn.neighbors import LocalOutlierFactor
 from PyQt5.QtCore import Qt
 import pyqtgraph as pg
 from PyQt5 import QtCore, QtGui, QtWidgets
-import tkinter
-import matplotlib.pyplot as plt
 import math
-from datetime import datetime,timedelta
 
-plt.rcParams['font.family'] = 'SimHei'  # 使用中文字体
-plt.rcParams['axes.unicode_minus'] = False #显示负号
+# matplotlib 导入很慢，只在第一次用到时才导入，不拖慢登录框的出现
 pg.setConfigOption('background','w')
 pg.setConfigOption('foreground','k')
 
 
+# 日期/时间列即使不是数值也要保留，用于横坐标和按时间分组
+TIME_COLUMNS = ('日期', '时间')
+
+
+def detect_encoding(path: str, sample_size: int = 1 << 16) -> str:
+    # 读取文件开头的一段字节判断编码：有 BOM 或能按 UTF-8 解码就用 UTF-8，
+    # 否则用 GB18030（兼容 GB2312/GBK，记录仪导出的中文表头多是这类编码）
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # 样本末尾截断了一个多字节字符，不算解码失败
+        if len(sample) == sample_size and e.start >= len(sample) - 3:
+            return 'utf-8'
+    return 'gb18030'
+
+
+def read_csv_chunked(path: str, keep_columns=(), chunksize: int = None) -> pd.DataFrame:
+    # 分块读取 CSV，内存占用与压缩后的数据相当：先读前几千行确定各列类型，之后按这些类型分块解析；
+    # 要保留的文本列（日期、时间、横坐标）读成 category，从不绘图的文本列不读取。
+    # 每块读入后立即追加到各列预先分配的数组中（能无损表示的浮点数存成 float32，文本列只存类别编码），
+    # 随即释放，不保留各块，也不最后再拼接一份
+    encoding = detect_encoding(path)
+    sample = pd.read_csv(path, encoding=encoding, nrows=5000)
+    if len(sample) == 0:
+        return sample
+    names = list(sample.columns)
+    numeric = [col for col in names if pd.api.types.is_numeric_dtype(sample[col].dtype)]
+    keep = [col for col in names if col in numeric or col in keep_columns]
+    # 整数列不指定类型：后面出现缺失值时该块按浮点数解析，追加时整列升级
+    dtypes = {col: 'category' for col in keep if col not in numeric}
+    dtypes.update({col: np.float64 for col in numeric if sample[col].dtype.kind == 'f'})
+
+    # 按文件开头 1MB 的行数估计总行数，数组一次分配到位，估计偏小时再按 2 倍增长。
+    # 解析一块时的临时内存是这块文本的好几倍，默认每块约 4MB 文本
+    with open(path, 'rb') as f:
+        head = f.read(1 << 20)
+    row_bytes = max(len(head), 1) / max(head.count(b'\n'), 1)
+    chunksize = chunksize or max(int((4 << 20) / row_bytes), 1000)
+    capacity = int(os.path.getsize(path) / row_bytes * 1.05) + chunksize
+    buffers = {}
+    views = {}
+    decimals = {}
+    categories = {}
+
+    def append(col, values):
+        if col not in views:
+            buffers[col] = np.empty(capacity, dtype=values.dtype)
+            views[col] = buffers[col][:0]
+        views[col] = grow_buffer(buffers, col, views[col], values)
+
+    def widen(col):
+        # 已有数据改存 float64（float32 列按记录的小数位数还原，整数列出现了缺失值），容量不变
+        view = views[col]
+        buffers[col] = np.empty(len(buffers[col]), dtype=np.float64)
+        buffers[col][:len(view)] = widen_float32(view, decimals.pop(col, None))
+        views[col] = buffers[col][:len(view)]
+
+    def add_chunk(chunk):
+        for col in keep:
+            series = chunk[col]
+            if col not in numeric:
+                # 各块的类别不同：新类别加在末尾，本块的编码换算成整列的编码（缺失值为 -1）
+                codes = categories.setdefault(col, {})
+                lookup = [codes.setdefault(cat, len(codes)) for cat in series.cat.categories.tolist()]
+                lookup = np.array(lookup + [-1], dtype=np.int32)
+                append(col, lookup[series.cat.codes.to_numpy()])
+                continue
+            if not pd.api.types.is_numeric_dtype(series.dtype):
+                # 混入了非数值内容时按缺失值处理，保持数值列
+                series = pd.to_numeric(series, errors='coerce')
+            values = series.to_numpy()
+            if values.dtype.kind == 'f' and col in views and views[col].dtype.kind in 'iu':
+                widen(col)
+            elif values.dtype.kind == 'f' and (col not in views or col in decimals):
+                values = values.astype(np.float64, copy=False)
+                places = float32_decimals(values)
+                if col in views and places is not None and places > decimals[col]:
+                    # 小数位数变多：已有数据在新的位数下仍能还原时继续用 float32
+                    old = views[col].astype(np.float64)
+                    if not np.array_equal(np.round(old, places), np.round(old, decimals[col])):
+                        places = None
+                if places is None:
+                    if col in decimals:
+                        widen(col)
+                else:
+                    decimals[col] = max(places, decimals.get(col, 0))
+                    values = values.astype(np.float32)
+            append(col, values)
+
+    def chunks():
+        rows = 0
+        try:
+            for chunk in pd.read_csv(path, encoding=encoding, chunksize=chunksize, usecols=keep, dtype=dtypes,
+                                     low_memory=False):
+                rows += len(chunk)
+                yield chunk
+            return
+        except (ValueError, TypeError, OverflowError):
+            pass
+        # 某一块与前几千行的类型不一致（浮点列混入文本等）：从这一块开始不再指定数值列的类型，
+        # 由 add_chunk 逐块转换，已经读入的行不重新读取
+        yield from pd.read_csv(path, encoding=encoding, chunksize=chunksize, header=None, names=names,
+                               skiprows=rows + 1, usecols=keep, low_memory=False,
+                               dtype={col: 'category' for col in keep if col not in numeric})
+
+    for chunk in chunks():
+        add_chunk(chunk)
+    data = {}
+    for col in keep:
+        if col in categories:
+            data[col] = pd.Categorical.from_codes(views[col], categories=list(categories[col]))
+        else:
+            data[col] = views[col]
+    df = pd.DataFrame(data, columns=keep, copy=False)
+    df.attrs['decimals'] = decimals
+    return df
+
+
+def read_table(path: str, keep_columns=()) -> pd.DataFrame:
+    if path.endswith('.xlsx'):
+        return pd.read_excel(path, engine='openpyxl')
+    elif path.endswith('.csv'):
+        return read_csv_chunked(path, keep_columns)
+    raise ValueError(f"不支持的文件类型: {path}")
+
+
+class CsvTailer:
+    # 跟踪记录仪不断追加的 CSV：记住已经读到的字节位置，每次只解析新增的完整行
+    def __init__(self, path: str, columns):
+        self.path = path
+        encoding = detect_encoding(path)
+        self.names = list(pd.read_csv(path, nrows=0, encoding=encoding).columns)
+        self.columns = [col for col in columns if col in self.names]
+        # BOM 只在文件开头，从中间读取时按普通 UTF-8 解码
+        self.encoding = 'utf-8' if encoding == 'utf-8-sig' else encoding
+        self.offset = os.path.getsize(path)
+        # 打开时最后一行还没写完的话，它的剩余部分会出现在下一次读取的开头，
+        # 这一行已经按不完整的内容读入，剩余部分跳过
+        self.skip_partial = False
+        if self.offset > 0:
+            with open(path, 'rb') as f:
+                f.seek(self.offset - 1)
+                self.skip_partial = f.read(1) not in (b'\n', b'\r')
+
+    def read_new(self) -> pd.DataFrame:
+        # 返回新增的行（可能为空）；文件变短（被截断或替换）时返回 None，需要整体重新加载
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            return None
+        if size == self.offset:
+            return pd.DataFrame(columns=self.columns)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # 只处理到最后一个换行符，没写完的行留到下一次
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return pd.DataFrame(columns=self.columns)
+        self.offset += end
+        data = data[:end]
+        if self.skip_partial:
+            data = data[data.find(b'\n') + 1:]
+            self.skip_partial = False
+        if not data.strip():
+            return pd.DataFrame(columns=self.columns)
+        return pd.read_csv(io.BytesIO(data), header=None, names=self.names, usecols=self.columns,
+                           encoding=self.encoding, low_memory=False)[self.columns]
+
+
+def parse_time_index(values) -> np.ndarray:
+    # 横坐标一次性向量化解析为 datetime64[ns]：
+    # 整数按纳秒时间戳（pandas 读出的日期列 .tolist() 后就是纳秒整数），
+    # 字符串支持 %Y-%m-%d 和 %Y/%m/%d（可带时间），datetime/Timestamp/datetime64 直接转换
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    s = s.reset_index(drop=True)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # 分类列只解析各个类别
+        parsed = parse_time_index(pd.Series(s.cat.categories.to_numpy(dtype=object)))
+        codes = s.cat.codes.to_numpy()
+        return np.where(codes >= 0, parsed[codes], np.datetime64('NaT', 'ns'))
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        if getattr(s.dt, 'tz', None) is not None:
+            s = s.dt.tz_localize(None)
+        return s.to_numpy(dtype='datetime64[ns]')
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return pd.to_datetime(s, unit='ns').to_numpy(dtype='datetime64[ns]')
+    out = np.full(len(s), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if pd.api.types.infer_dtype(s, skipna=True) == 'string':
+        # 常见情况：整列都是字符串，不必逐个判断类型
+        str_mask = s.notna().to_numpy()
+        int_mask = np.zeros(len(s), dtype=bool)
+    else:
+        kinds = s.map(type)
+        str_mask = (kinds == str).to_numpy()
+        int_mask = kinds.map(lambda t: issubclass(t, (int, np.integer)) and not issubclass(t, bool)).to_numpy()
+    other_mask = ~(str_mask | int_mask) & s.notna().to_numpy()
+    if str_mask.any():
+        # 日期列重复值很多，只解析不重复的字符串
+        codes, uniques = pd.factorize(s[str_mask])
+        strs = pd.Series(uniques).str.strip().str.replace('/', '-', regex=False)
+        try:
+            parsed = pd.to_datetime(strs, format='ISO8601')
+        except ValueError:
+            parsed = pd.to_datetime(strs, format='mixed')
+        out[str_mask] = parsed.to_numpy(dtype='datetime64[ns]')[codes]
+    if int_mask.any():
+        out[int_mask] = pd.to_datetime(s[int_mask].astype('int64'), unit='ns').to_numpy(dtype='datetime64[ns]')
+    if other_mask.any():
+        out[other_mask] = pd.to_datetime(s[other_mask]).to_numpy(dtype='datetime64[ns]')
+    return out
+
+
+def float32_decimals(values: np.ndarray, max_decimals: int = 6) -> int:
+    # 记录仪数据一般只有几位小数：按数据实际的小数位数取整后，
+    # 转成 float32 再转回来数值不变，就可以用 float32 保存。返回小数位数，不能无损保存时返回 None
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return 0
+    sample = finite[::max(len(finite) // 100000, 1)]
+    for decimals in range(max_decimals + 1):
+        if np.array_equal(np.round(sample, decimals), sample):
+            break
+    else:
+        return None
+    if not np.array_equal(np.round(finite.astype(np.float32).astype(np.float64), decimals), finite):
+        return None
+    return decimals
+
+
+def widen_float32(values: np.ndarray, decimals: int = None) -> np.ndarray:
+    # 转成 float64 参与计算；float32 列按压缩时记录的小数位数取整，
+    # 得到与源文件一致的数值（如 -0.07 而不是 -0.06999999...）
+    values = np.asarray(values)
+    if values.dtype != np.float32 or decimals is None:
+        return values.astype(np.float64, copy=False)
+    return np.round(values.astype(np.float64), decimals)
+
+
+def compact_frame(df: pd.DataFrame, keep_columns=()) -> tuple:
+    # 载入后压缩数据类型：能无损表示的 float64 列用 float32，整数列取最小的整数类型，
+    # “日期”转成 datetime64，其余要保留的文本列（时间、横坐标）重复值多时转成 category，
+    # 不需要的文本列丢弃。返回 (压缩后的表, 压缩前字节数, 压缩后字节数)；
+    # 各 float32 列的小数位数记在 df.attrs['decimals'] 中，转回 float64 时据此取整
+    before = int(df.memory_usage(deep=True).sum())
+    data = {}
+    decimals = {}
+    for col in df.columns:
+        series = df[col]
+        dtype = series.dtype
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+            data[col] = series
+        elif pd.api.types.is_float_dtype(dtype):
+            places = float32_decimals(series.to_numpy()) if dtype == np.float64 else None
+            if dtype == np.float32 and col in df.attrs.get('decimals', {}):
+                # 分块读取时已经存成 float32 的列
+                data[col] = series
+                decimals[col] = df.attrs['decimals'][col]
+            elif places is not None:
+                data[col] = series.astype(np.float32)
+                decimals[col] = places
+            else:
+                data[col] = series
+        elif pd.api.types.is_integer_dtype(dtype):
+            # 已经是最小类型时 to_numeric 仍返回副本，保留原列
+            downcast = pd.to_numeric(series, downcast='integer')
+            data[col] = series if downcast.dtype == dtype else downcast
+        elif pd.api.types.is_numeric_dtype(dtype):
+            data[col] = series
+        elif col in keep_columns:
+            parsed = None
+            if col == '日期':
+                try:
+                    parsed = parse_time_index(series)
+                except (ValueError, TypeError):
+                    pass
+            if parsed is not None and np.isnat(parsed).sum() == series.isna().sum():
+                data[col] = pd.Series(parsed, index=df.index)
+            elif series.nunique() <= len(series) // 2:
+                data[col] = series.astype('category')
+            else:
+                data[col] = series
+    # 从字典构造表默认会复制每一列，copy=False 时未改变的列与原表共用内存
+    df = pd.DataFrame(data, index=df.index, copy=False)
+    df.attrs['decimals'] = decimals
+    return df, before, int(df.memory_usage(deep=True).sum())
+
+
+def fill_missing(values, window: int = 4) -> np.ndarray:
+    # 缺失值插补：0和NaN视为缺失，用前后window个有效值（非0非NaN）的均值填充，
+    # 窗口内没有有效值时用整列有效值的均值。
+    # 用累加和/计数求滚动窗口，O(n)；二维输入时每一列独立处理
+    arr = np.asarray(values, dtype=float)
+    is_1d = arr.ndim == 1
+    if is_1d:
+        arr = arr[:, None]
+    n = arr.shape[0]
+    valid = np.isfinite(arr) & (arr != 0)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        col_mean = np.where(valid, arr, 0.0).sum(axis=0) / count
+    # 减去列均值后再累加，减小长序列累加和相减的舍入误差
+    centered = np.where(valid, arr - np.nan_to_num(col_mean), 0.0)
+    csum = np.zeros((n + 1, arr.shape[1]))
+    np.cumsum(centered, axis=0, out=csum[1:])
+    ccnt = np.zeros((n + 1, arr.shape[1]), dtype=np.int64)
+    np.cumsum(valid, axis=0, out=ccnt[1:])
+
+    idx = np.arange(n)
+    lo = np.maximum(idx - window, 0)
+    hi = np.minimum(idx + window + 1, n)
+    # 缺失位置本身不计入和与计数，所以窗口里包含自身也不影响结果
+    win_sum = csum[hi] - csum[lo]
+    win_cnt = ccnt[hi] - ccnt[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        neighbour_mean = win_sum / win_cnt + np.nan_to_num(col_mean)
+    result = np.where(valid, arr, np.where(win_cnt > 0, neighbour_mean, col_mean))
+    return result[:, 0] if is_1d else result
+
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, n_buckets: int) -> tuple:
+    # 按桶取最小值和最大值（按时间先后顺序输出），约 2*n_buckets 个点，尖峰不会被平均掉；
+    # NaN 不参与比较，整桶都是NaN时保留为NaN，connect='finite' 下仍显示为断点
+    n = len(y)
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return x, y
+    size = int(math.ceil(n / n_buckets))
+    m = n // size
+    idx_parts = []
+    for start, count in ((0, m), (m * size, 1 if n > m * size else 0)):
+        if count <= 0:
+            continue
+        stop = n if start == m * size else m * size
+        block = y[start:stop].reshape(count, -1)
+        nan_mask = np.isnan(block)
+        imax = np.where(nan_mask, -np.inf, block).argmax(axis=1)
+        imin = np.where(nan_mask, np.inf, block).argmin(axis=1)
+        base = start + np.arange(count) * block.shape[1]
+        idx = np.empty(2 * count, dtype=np.int64)
+        idx[0::2] = base + np.minimum(imin, imax)
+        idx[1::2] = base + np.maximum(imin, imax)
+        idx_parts.append(idx)
+    idx = np.concatenate(idx_parts)
+    return x[idx], y[idx]
+
+
+class MinMaxPyramid:
+    # 折线抽稀用的最小/最大值金字塔：第 k 层每块 base*2^k 个点，记录块内最小值、最大值的下标（int32）。
+    # 整列只扫描一次；之后任意可见范围只取相应层中覆盖该范围的块，不再扫描原始数据。
+    # 实时追加数据时只重算末尾受影响的块。各层下标合计约 n/2 字节（n 为数据点数）
+    base = 32
+
+    def __init__(self):
+        self.levels: list = []
+        self.n = 0
+        self.buffers: dict = {}
+
+    @staticmethod
+    def pair_minmax(y: np.ndarray, imin: np.ndarray, imax: np.ndarray) -> tuple:
+        # 相邻两块合并成一块；NaN 不参与比较，两块都是NaN时仍指向NaN
+        if len(imin) % 2:
+            imin = np.append(imin, imin[-1])
+            imax = np.append(imax, imax[-1])
+        vmin = y[imin]
+        vmax = y[imax]
+        vmin = np.where(np.isnan(vmin), np.inf, vmin)
+        vmax = np.where(np.isnan(vmax), -np.inf, vmax)
+        take_min = vmin[1::2] < vmin[0::2]
+        take_max = vmax[1::2] > vmax[0::2]
+        return (np.where(take_min, imin[1::2], imin[0::2]).astype(np.int32),
+                np.where(take_max, imax[1::2], imax[0::2]).astype(np.int32))
+
+    def update(self, y: np.ndarray):
+        # y 在末尾追加了数据（或被整体替换、变短时重建），重算从旧末尾所在块开始的各层
+        n = len(y)
+        if n < self.n:
+            self.levels, self.buffers, self.n = [], {}, 0
+        if n == self.n:
+            return
+        start = self.n
+        size = self.base
+        k = 0
+        while size < n:
+            # 数据变长后新出现的层从头计算
+            b = start // size if k < len(self.levels) else 0
+            if k == 0:
+                stop = b * size + (n - b * size) // size * size
+                block = y[b * size:stop].reshape(-1, size)
+                nan_mask = np.isnan(block)
+                offsets = b * size + np.arange(len(block)) * size
+                imin = (offsets + np.where(nan_mask, np.inf, block).argmin(axis=1)).astype(np.int32)
+                imax = (offsets + np.where(nan_mask, -np.inf, block).argmax(axis=1)).astype(np.int32)
+                if stop < n:
+                    # 末尾不满一块的部分
+                    tail = y[stop:n]
+                    nan_tail = np.isnan(tail)
+                    imin = np.append(imin, np.int32(stop + np.where(nan_tail, np.inf, tail).argmin()))
+                    imax = np.append(imax, np.int32(stop + np.where(nan_tail, -np.inf, tail).argmax()))
+            else:
+                child_min, child_max = self.levels[k - 1]
+                imin, imax = self.pair_minmax(y, child_min[2 * b:], child_max[2 * b:])
+            if k < len(self.levels):
+                old_min, old_max = self.levels[k]
+                self.levels[k] = (grow_buffer(self.buffers, ('min', k), old_min[:b], imin),
+                                  grow_buffer(self.buffers, ('max', k), old_max[:b], imax))
+            else:
+                self.levels.append((imin, imax))
+            size *= 2
+            k += 1
+        self.n = n
+
+    def decimate(self, x: np.ndarray, y: np.ndarray, i0: int, i1: int, n_buckets: int) -> tuple:
+        # [i0, i1) 范围按约 n_buckets 个桶抽稀，输出点数不超过约 4*n_buckets
+        span = i1 - i0
+        if n_buckets <= 0 or span <= 2 * n_buckets:
+            return x[i0:i1], y[i0:i1]
+        k = int(math.floor(math.log2(span / n_buckets / self.base))) if span >= self.base * n_buckets else -1
+        k = min(k, len(self.levels) - 1)
+        if k < 0:
+            # 可见范围小，直接扫描这一段原始数据
+            return minmax_decimate(x[i0:i1], y[i0:i1], n_buckets)
+        size = self.base << k
+        imin, imax = self.levels[k]
+        b0 = i0 // size
+        b1 = -(-i1 // size)
+        lo = imin[b0:b1]
+        hi = imax[b0:b1]
+        idx = np.empty(2 * len(lo), dtype=np.int64)
+        idx[0::2] = np.minimum(lo, hi)
+        idx[1::2] = np.maximum(lo, hi)
+        return x[idx], y[idx]
+
+
+def grow_buffer(buffers: dict, key, view: np.ndarray, new: np.ndarray) -> np.ndarray:
+    # 把 new 追加到 view 之后，返回追加后的视图。缓冲区容量按 2 倍增长，有余量时原地写入，
+    # 已有数据不复制，反复追加的总代价与数据量成正比
+    buf = buffers.get(key)
+    n = len(view)
+    dtype = np.result_type(view, new)
+    if buf is None or view.base is not buf or n + len(new) > len(buf) or buf.dtype != dtype:
+        bigger = np.empty(max(2 * (n + len(new)), 1024), dtype=dtype)
+        bigger[:n] = view
+        buf = bigger
+    buf[n:n + len(new)] = new
+    buffers[key] = buf
+    return buf[:n + len(new)]
+
+
+def get_pyplot():
+    # 第一次绘图时才导入 matplotlib，并设置中文字体
+    import matplotlib.pyplot as plt
+    plt.rcParams['font.family'] = 'SimHei'  # 使用中文字体
+    plt.rcParams['axes.unicode_minus'] = False #显示负号
+    return plt
+
+
+class OperationCancelled(Exception):
+    # 后台处理被取消时，耗时较长的计算函数在检查点抛出，尽快结束
+    pass
+
+
+def check_cancel(cancel: threading.Event):
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled()
+
+
+def zscore_normalize(values: np.ndarray) -> np.ndarray:
+    # z-score 标准化，与 pandas 的 std 一致（ddof=1，忽略NaN）
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - np.nanmean(values, axis=0)) / np.nanstd(values, axis=0, ddof=1)
+
+
+def minmax_normalize(values: np.ndarray) -> np.ndarray:
+    col_min = np.nanmin(values, axis=0)
+    col_max = np.nanmax(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - col_min) / (col_max - col_min)
+
+
+def lof_scores_1d(x: np.ndarray, n_neighbors: int = 20, cancel: threading.Event = None) -> np.ndarray:
+    # 一维数据的精确 LOF，返回负的局部离群因子（与 sklearn 的 negative_outlier_factor_ 一致）。
+    # 排序后每个点和它的 k 个最近邻是连续的 k+1 个位置 [l, l+k]，
+    # 对 l 做向量化二分查找即可，不需要近邻树：排序 O(n log n)，其余 O(n k) 的逐元素运算
+    n = len(x)
+    k = min(n_neighbors, n - 1)
+    order = np.argsort(x, kind='stable')
+    xs = x[order]
+    i = np.arange(n)
+
+    # 窗口左端 l 取值范围 [i-k, i]，且不能越界；左侧距离随 l 增大而减小，右侧距离增大，
+    # 找两者交叉的位置，再和前一个位置比较取最大距离更小的那个
+    lo = np.maximum(i - k, 0)
+    hi = np.minimum(i, n - 1 - k)
+    lower = lo.copy()
+    while True:
+        check_cancel(cancel)
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        right_longer = (xs[mid + k] - xs) >= (xs - xs[mid])
+        hi = np.where(active & right_longer, mid, hi)
+        lo = np.where(active & ~right_longer, mid + 1, lo)
+    left = lo
+    k_dist = np.maximum(xs - xs[left], xs[left + k] - xs)
+    prev = np.maximum(left - 1, lower)
+    prev_dist = np.maximum(xs - xs[prev], xs[prev + k] - xs)
+    better = prev_dist < k_dist
+    left = np.where(better, prev, left)
+    k_dist = np.where(better, prev_dist, k_dist)
+
+    # 可达距离之和、近邻 lrd 之和都按偏移逐个累加，跳过点自身
+    # （有重复值时 lrd 可达 1e10，不用前缀和以免相减丢失精度）
+    reach_sum = np.zeros(n)
+    for m in range(k + 1):
+        check_cancel(cancel)
+        j = left + m
+        reach = np.maximum(k_dist[j], np.abs(xs[j] - xs))
+        reach_sum += np.where(j == i, 0.0, reach)
+    lrd = 1.0 / (reach_sum / k + 1e-10)
+    lrd_sum = np.zeros(n)
+    for m in range(k + 1):
+        check_cancel(cancel)
+        j = left + m
+        lrd_sum += np.where(j == i, 0.0, lrd[j])
+    nbr_lrd_mean = lrd_sum / k
+    nof = np.empty(n)
+    nof[order] = -nbr_lrd_mean / lrd
+    return nof
+
+
+def lof_outliers_1d(x: np.ndarray, n_neighbors: int = 20, contamination='auto', window: int = 0,
+                    cancel: threading.Event = None) -> np.ndarray:
+    # 返回异常值掩码。contamination='auto' 时局部离群因子大于1.5判为异常（与 sklearn 相同），
+    # 为小数时取得分最低的该比例。window>0 时按时间顺序分段分别检测，只和附近时间的数据比较，内存也有界
+    n = len(x)
+    mask = np.zeros(n, dtype=bool)
+    if n < 2:
+        return mask
+    bounds = [0, n]
+    if window and n > window:
+        bounds = list(range(0, n, window)) + [n]
+        # 最后一段太短时并入前一段
+        if len(bounds) > 2 and bounds[-1] - bounds[-2] <= n_neighbors:
+            del bounds[-2]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi - lo < 2:
+            continue
+        nof = lof_scores_1d(x[lo:hi], n_neighbors, cancel)
+        if contamination == 'auto':
+            offset = -1.5
+        else:
+            offset = np.percentile(nof, 100.0 * float(contamination))
+        mask[lo:hi] = nof < offset
+    return mask
+
+
+def lof_filter(values: np.ndarray, n_neighbors: int = 20, contamination='auto', window: int = 0,
+               cancel: threading.Event = None) -> np.ndarray:
+    # 每一列当作一维点云检测异常，异常值替换为NaN；NaN 行不参与检测。多列时各列并行。
+    # 取消时正在计算的列在下一个检查点退出，尚未开始的列不再计算
+    result = values.copy()
+
+    def one_column(k):
+        finite = np.flatnonzero(np.isfinite(values[:, k]))
+        outliers = lof_outliers_1d(values[finite, k], n_neighbors, contamination, window, cancel)
+        result[finite[outliers], k] = np.nan
+
+    if values.shape[1] > 1:
+        executor = ThreadPoolExecutor(max_workers=min(values.shape[1], os.cpu_count() or 1))
+        try:
+            futures = [executor.submit(STAGES.profiled(one_column), k) for k in range(values.shape[1])]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        one_column(0)
+    return result
+
+
+class OnlineOutlierDetector:
+    # 滑动窗口 z-score 在线异常值检测，数据可以分批送入，逐条到来的样本 O(1) 更新；
+    # 与前 window 个有效值的均值相差超过 threshold 倍标准差的判为异常，NaN 不参与统计
+    def __init__(self, n_columns: int, window: int = 60, threshold: float = 3.0, min_periods: int = None):
+        self.window = window
+        self.threshold = threshold
+        self.min_periods = min(min_periods or window, window)
+        self.buffer = np.zeros((window, n_columns))
+        self.pos = np.zeros(n_columns, dtype=np.int64)
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        # 累计和相对参考值计算，每写满一轮按缓冲区重算一次，避免大数相减和误差累积
+        self.ref = np.zeros(n_columns)
+        self.sum = np.zeros(n_columns)
+        self.sumsq = np.zeros(n_columns)
+        self.pushes = np.zeros(n_columns, dtype=np.int64)
+
+    def history(self, k: int) -> np.ndarray:
+        # 第 k 列窗口内的有效值，按到达顺序
+        if self.count[k] < self.window:
+            return self.buffer[:self.count[k], k]
+        return np.roll(self.buffer[:, k], -self.pos[k])
+
+    def rebase(self, k: int):
+        values = self.history(k)
+        self.ref[k] = values.mean() if len(values) else 0.0
+        self.sum[k] = (values - self.ref[k]).sum()
+        self.sumsq[k] = ((values - self.ref[k]) ** 2).sum()
+        self.pushes[k] = 0
+
+    def push(self, k: int, v: float) -> bool:
+        n = self.count[k]
+        outlier = False
+        if n >= self.min_periods:
+            d = self.sum[k] / n
+            std = math.sqrt(max(self.sumsq[k] / n - d * d, 0.0))
+            outlier = std > 0 and abs(v - self.ref[k] - d) > self.threshold * std
+        pos = self.pos[k]
+        if n == self.window:
+            old = self.buffer[pos, k] - self.ref[k]
+            self.sum[k] -= old
+            self.sumsq[k] -= old * old
+        else:
+            self.count[k] += 1
+        self.buffer[pos, k] = v
+        self.sum[k] += v - self.ref[k]
+        self.sumsq[k] += (v - self.ref[k]) ** 2
+        self.pos[k] = (pos + 1) % self.window
+        self.pushes[k] += 1
+        if self.pushes[k] >= self.window:
+            self.rebase(k)
+        return outlier
+
+    def push_block(self, k: int, x: np.ndarray) -> np.ndarray:
+        # 一次送入很多行时用 pandas 的滚动统计整体计算，结果与逐条送入相同
+        hist = self.history(k)
+        seq = np.concatenate([hist, x])
+        rolling = pd.Series(seq).rolling(self.window, min_periods=1)
+        mean = rolling.mean().to_numpy()
+        std = rolling.std(ddof=0).to_numpy()
+        j = np.arange(len(hist), len(seq))
+        prev = np.maximum(j - 1, 0)
+        outlier = ((np.minimum(j, self.window) >= self.min_periods) & (std[prev] > 0)
+                   & (np.abs(x - mean[prev]) > self.threshold * std[prev]))
+        tail = seq[-self.window:]
+        self.count[k] = len(tail)
+        self.buffer[:len(tail), k] = tail
+        self.pos[k] = len(tail) % self.window
+        self.rebase(k)
+        return outlier
+
+    def update(self, values: np.ndarray, cancel: threading.Event = None) -> np.ndarray:
+        # values 为 (新增行数, 列数)，返回同形状的异常标记
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        mask = np.zeros(values.shape, dtype=bool)
+        for k in range(values.shape[1]):
+            check_cancel(cancel)
+            finite = np.flatnonzero(np.isfinite(values[:, k]))
+            if len(finite) > self.window:
+                mask[finite, k] = self.push_block(k, values[finite, k])
+            else:
+                for i in finite:
+                    mask[i, k] = self.push(k, values[i, k])
+        return mask
+
+
+def online_outlier_filter(values: np.ndarray, window: int = 60, threshold: float = 3.0,
+                          cancel: threading.Event = None) -> np.ndarray:
+    # 与在线检测相同的规则处理整段数据，异常值替换为NaN
+    result = values.copy()
+    result[OnlineOutlierDetector(values.shape[1], window, threshold).update(values, cancel)] = np.nan
+    return result
+
+
+def moving_average(values: np.ndarray, window: int = 3) -> np.ndarray:
+    return pd.DataFrame(values).rolling(window=window).mean().to_numpy()
+
+
+def ewm_mean(values: np.ndarray, alpha: float = 0.2) -> np.ndarray:
+    return pd.DataFrame(values).ewm(alpha=alpha).mean().to_numpy()
+
+
+def first_diff(values: np.ndarray, keys) -> np.ndarray:
+    # 每组（如每天）首条记录与上一组首条记录的差值，其余行为NaN
+    first = ~pd.Series(keys).duplicated(keep='first').to_numpy()
+    result = np.full(values.shape, np.nan)
+    firsts = values[first]
+    diffs = np.full(firsts.shape, np.nan)
+    diffs[1:] = firsts[1:] - firsts[:-1]
+    result[first] = diffs
+    return result
+
+
+def bucket_first_rows(timestamp, interval: str) -> tuple:
+    # 按时间排序后每个时间段（如 10min、1h、1D）首条记录的行号，以及各时间段起点（ns 整数）
+    ts = np.asarray(timestamp, dtype='datetime64[ns]')
+    valid = np.flatnonzero(~np.isnat(ts))
+    order = valid[np.argsort(ts[valid], kind='stable')]
+    buckets = pd.DatetimeIndex(ts[order]).floor(interval).asi8
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(buckets) else np.array([], dtype=np.int64)
+    return order[first], buckets[first]
+
+
+def transpiration_rate(values: np.ndarray, timestamp, interval: str = '1h') -> np.ndarray:
+    # 相邻时间段首条记录的差值除以两段起点相隔的小时数即蒸腾速率(g/h)；
+    # 所有列一起计算，结果写在首条记录所在行，其余行为NaN
+    rows, starts = bucket_first_rows(timestamp, interval)
+    firsts = values[rows]
+    hours = np.diff(starts) / 3.6e12
+    result = np.full(values.shape, np.nan)
+    result[rows[1:]] = (firsts[1:] - firsts[:-1]) / hours[:, None]
+    return result
+
+
+def stomatal_conductance(values: np.ndarray, timestamp, interval: str = '1h', pairs=None) -> np.ndarray:
+    # 气孔导度 gsc：values 的两列为公式中的 m1、m2，结果为一列，写在每个时间段结束行，其余行为NaN。
+    # pairs 为 [(开始时间, 结束时间), ...] 时只计算这些时间段，每个时间取该时刻起 interval 内的第一条记录，
+    # 没有记录（缺数据）的时间段结果为NaN，不会取到之后时段的数据；
+    # 否则计算每两个相邻时间段（按 interval 划分）首条记录之间的气孔导度
+    m1, m2 = values[:, 0], values[:, 1]
+    ts = np.asarray(timestamp, dtype='datetime64[ns]')
+    if pairs:
+        # 排序后的时间上二分查找
+        valid = np.flatnonzero(~np.isnat(ts))
+        order = valid[np.argsort(ts[valid], kind='stable')]
+        bounds = parse_time_index([t for pair in pairs for t in pair]).reshape(-1, 2)
+        sorted_ts = ts[order]
+        pos = np.searchsorted(sorted_ts, bounds)
+        found = pos < len(order)
+        width = np.timedelta64(pd.Timedelta(interval).value, 'ns')
+        found[found] = sorted_ts[pos[found]] < bounds[found] + width
+        ok = found.all(axis=1)
+        i, j = order[pos[ok, 0]], order[pos[ok, 1]]
+        hours = (bounds[ok, 1] - bounds[ok, 0]) / np.timedelta64(1, 'h')
+    else:
+        rows, starts = bucket_first_rows(ts, interval)
+        i, j = rows[:-1], rows[1:]
+        hours = np.diff(starts) / 3.6e12
+    # 公式
+    E = hours * (m1[j] - m1[i]) / (m2[j] - m2[i])
+    gsc = E * 101.3 / (0.610788 * np.exp(17.27 * m1[j] / (m1[j] + 237.3)) * (1 - m1[i]))
+    result = np.full((len(ts), 1), np.nan)
+    result[j, 0] = gsc
+    return result
+
+
+# 处理操作：名称 -> (派生列后缀, 计算函数)。计算函数的输入输出都是 (行数, 列数) 的二维数组
+OPERATIONS = {
+    'zscore': ('_z-score标准化', zscore_normalize),
+    'minmax': ('_最大最小标准化', minmax_normalize),
+    'impute': ('_缺失值处理', fill_missing),
+    'lof': ('_LOF异常值处理', lof_filter),
+    'online': ('_在线异常值处理', online_outlier_filter),
+    'moving_average': ('_移动平均滤波', moving_average),
+    'ewm': ('_均值滤波', ewm_mean),
+    'change': ('_变化值', first_diff),
+    'rate': ('_蒸腾速率', transpiration_rate),
+}
+
+
+# 蒸腾速率可选的时间段
+RATE_INTERVALS = {'10分钟': '10min', '1小时': '1h', '1天': '1D'}
+# 气孔导度时间段输入中的时间，如 2022-09-14 20 或 2022/9/14 20:30
+TIME_PATTERN = re.compile(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}(?:[ T]\d{1,2}(?::\d{2}){0,2})?')
+
+
+def frame_timestamp(df: pd.DataFrame, x_field: str) -> np.ndarray:
+    # 有“日期”和“时间”两列时合并成时间戳，否则解析横坐标字段
+    if '日期' in df.columns and '时间' in df.columns:
+        date = df['日期']
+        if pd.api.types.is_datetime64_any_dtype(date.dtype):
+            date = date.dt.strftime('%Y-%m-%d')
+        return parse_time_index(date.astype(str) + ' ' + df['时间'].astype(str))
+    return parse_time_index(df[x_field])
+
+
+def operation_context(op: str, df: pd.DataFrame, x_field: str) -> dict:
+    # 需要按日期/时间分组的操作所需的额外参数
+    if op == 'change':
+        return {'keys': df['日期'] if '日期' in df.columns else df[x_field]}
+    if op == 'rate':
+        return {'timestamp': frame_timestamp(df, x_field)}
+    return {}
+
+
+# 只依赖当前及之前数据的操作，实时跟踪文件时新行的结果可以增量计算
+RUNNING_OPERATIONS = ('online', 'moving_average', 'ewm', 'rate')
+
+
+def running_start(op: str, params: dict, ts: np.ndarray, n_old: int) -> int:
+    # 增量计算新行时需要一起参与计算的历史行起点（假设新行的时间不早于已有数据）
+    if op == 'moving_average':
+        return max(n_old - params.get('window', 3) + 1, 0)
+    if op == 'ewm':
+        # 更早数据的权重不到 1e-12，可以忽略
+        alpha = params.get('alpha', 0.2)
+        return max(n_old - int(math.log(1e-12) / math.log(1 - alpha)) - 1, 0) if alpha < 1 else n_old
+    if op == 'rate':
+        # 从历史最后一个时间段的首条记录开始
+        last = pd.Timestamp(ts[n_old - 1]).floor(params.get('interval', '1h')).to_datetime64()
+        return int(np.searchsorted(ts[:n_old], last, 'left'))
+    return n_old
+
+
+def extend_running(op: str, params: dict, values: np.ndarray, ts: np.ndarray, n_old: int, state=None) -> np.ndarray:
+    # 返回 values[n_old:] 这些新行的处理结果；values 为 (行数, 1)
+    if op == 'online':
+        result = values[n_old:].copy()
+        result[state.update(result)] = np.nan
+        return result
+    start = running_start(op, params, ts, n_old)
+    context = {'timestamp': ts[start:]} if op == 'rate' else {}
+    return OPERATIONS[op][1](values[start:], **params, **context)[n_old - start:]
+
+
+class StageRecorder:
+    # 读取、解析、计算、写回、绘制各阶段的耗时、行数和内存峰值，可写入按大小轮换的 JSON 日志
+    # profile_stage 为阶段名时，该阶段下一次运行用 cProfile 采集
+    names = ('load', 'parse', 'compact', 'compute', 'write-back', 'render')
+
+    def __init__(self, max_records: int = 500):
+        self.records = deque(maxlen=max_records)
+        # 每条记录完成后调用，可能在后台线程中
+        self.listeners = []
+        self.logger = None
+        self.log_path = ''
+        self.profile_stage = ''
+        self.last_profile = ''
+        # 正在采集的阶段中经 profiled 包装、在工作线程里执行的调用各自的 cProfile，结束时合并
+        self.worker_profiles: list = None
+        # 进行中各阶段到目前为止的内存峰值；内层阶段开始时要重置峰值，先把当前峰值计入外层
+        self.peaks: list = []
+        # 阶段可能同时在界面线程和后台线程中开始，领取 profile_stage 时加锁
+        self.lock = threading.Lock()
+
+    def set_log_path(self, path: str, max_bytes: int = 1 << 20, backup_count: int = 5):
+        import logging
+        from logging.handlers import RotatingFileHandler
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.logger = logging.getLogger('analysis.stages')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        self.log_path = path
+
+    @staticmethod
+    def set_trace_memory(enabled: bool):
+        # tracemalloc 会拖慢内存分配，默认关闭；内存峰值是整个进程的，阶段并行时会互相包含
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0, **info):
+        # with STAGES.stage('load', rows=n) as record: ...，代码块中可以补充 record['rows'] 等信息
+        record = {'stage': name, 'rows': rows, **info}
+        profiler = None
+        with self.lock:
+            if self.profile_stage == name:
+                import cProfile
+                self.profile_stage = ''
+                profiler = cProfile.Profile()
+                self.worker_profiles = []
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            peak = [0]
+            with self.lock:
+                self.update_peaks()
+                tracemalloc.reset_peak()
+                self.peaks.append(peak)
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['seconds'] = time.perf_counter() - start
+            record['peak_mb'] = None
+            if tracing:
+                with self.lock:
+                    self.update_peaks()
+                    self.peaks.remove(peak)
+                record['peak_mb'] = (peak[0] - base) / 2 ** 20
+            if profiler is not None:
+                workers, self.worker_profiles = self.worker_profiles, None
+                record['profile'] = self.save_profile(profiler, name, workers)
+                record['profile_threads'] = 1 + len(workers)
+            self.add(record)
+
+    def update_peaks(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for item in self.peaks:
+            item[0] = max(item[0], peak)
+
+    def profiled(self, func):
+        # cProfile 只采集调用它的线程：阶段中交给线程池执行的函数用它包装，
+        # 该阶段正在采集时在工作线程里另起一个 cProfile，结束时合并到该阶段的结果
+        def run(*args, **kwargs):
+            profiles = self.worker_profiles
+            if profiles is None:
+                return func(*args, **kwargs)
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 同一时间只允许一个 cProfile 的 Python 版本上不采集工作线程
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                profiles.append(profiler)
+        return run
+
+    def save_profile(self, profiler, name: str, workers=()) -> str:
+        # 原始数据（合并工作线程）存为 .prof（可用 snakeviz 等工具查看），另存一份按累计耗时排序的文本
+        import pstats
+        folder = os.path.dirname(self.log_path) if self.log_path else os.getcwd()
+        base = os.path.join(folder, f"profile_{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(profiler, *workers, stream=f)
+            stats.dump_stats(base + '.prof')
+            stats.sort_stats('cumulative').print_stats(40)
+        self.last_profile = base + '.txt'
+        return self.last_profile
+
+    def add(self, record: dict):
+        record['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.records.append(record)
+        if self.logger is not None:
+            self.logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        for listener in self.listeners:
+            listener(record)
+
+    @staticmethod
+    def details(record: dict) -> str:
+        return ' '.join(f'{k}={v}' for k, v in record.items()
+                        if k not in ('stage', 'rows', 'seconds', 'peak_mb', 'time') and v != '')
+
+    @staticmethod
+    def describe(record: dict) -> str:
+        text = f"{record['stage']} {StageRecorder.details(record)}: {record['seconds']:.3f}s, {record['rows']}行"
+        if record.get('peak_mb') is not None:
+            text += f", 内存峰值 {record['peak_mb']:.1f}MB"
+        return text
+
+
+STAGES = StageRecorder()
+
+
+class ResultCache:
+    # 处理结果的内存缓存，超过 max_bytes 时淘汰最久未使用的结果
+    # 键为 (文件, 数据版本, 横坐标字段, 原始列, 处理链)，处理链是 ((操作, 参数), ...)
+
+    def __init__(self, max_bytes: int = 512 << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        # 各列在线程池中并行计算，写入时加锁
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def stage(op: str, params: dict) -> tuple:
+        return (op, tuple(sorted(params.items())))
+
+    def get(self, key) -> np.ndarray:
+        if key is None:
+            return None
+        with self.lock:
+            values = self.entries.get(key)
+            if values is not None:
+                self.entries.move_to_end(key)
+            return values
+
+    def put(self, key, values: np.ndarray):
+        if key is None or values.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+            self.entries[key] = values
+            self.nbytes += values.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+class ParsedFileCache:
+    # 解析结果的持久化缓存：按 路径+大小+修改时间+内容哈希 区分文件，
+    # 每列存成一个 .npy（文本列用 pickle），解析好的时间索引也一起保存，
+    # 再次打开同一个文件时直接读取数组，不经过 openpyxl。
+    # 总大小超过上限时按最近使用时间（LRU）淘汰
+    def __init__(self, root: str = None, max_bytes: int = 2 << 30):
+        self.root = root or os.environ.get(
+            'ANALYSIS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.analysis_supervise', 'cache'))
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def content_hash(path: str, block: int = 1 << 20) -> str:
+        # 取文件开头、中间、结尾各 1MB 计算哈希，大文件也只读 3MB
+        size = os.path.getsize(path)
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for offset in sorted({0, max(size // 2 - block // 2, 0), max(size - block, 0)}):
+                f.seek(offset)
+                h.update(f.read(block))
+        return h.hexdigest()
+
+    def key(self, path: str, keep_columns=()) -> str:
+        # 压缩时不在 keep_columns 中的文本列会被丢弃（CSV、Excel 都是），缓存内容与保留的列有关
+        st = os.stat(path)
+        raw = json.dumps([os.path.abspath(path), st.st_size, st.st_mtime_ns,
+                          self.content_hash(path), list(keep_columns)], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def load(self, key: str, columns: list = None) -> pd.DataFrame:
+        # columns 不为 None 时只读取这些列
+        meta_path = os.path.join(self.entry_dir(key), 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if columns is not None:
+                meta['columns'] = [col for col in meta['columns'] if col['name'] in columns]
+            data = {}
+            decimals = {}
+            for col in meta['columns']:
+                file_path = os.path.join(self.entry_dir(key), col['file'])
+                if col['kind'] == 'npy':
+                    data[col['name']] = np.load(file_path, mmap_mode='r')
+                else:
+                    data[col['name']] = pd.read_pickle(file_path)
+                # 没有记录小数位数的 float32 列（旧版本的缓存）无法还原数值，当作未命中
+                if data[col['name']].dtype == np.float32:
+                    decimals[col['name']] = col['decimals']
+            # copy=False：数值列就是映射到磁盘的数组，用到时才读入内存
+            df = pd.DataFrame(data, columns=[col['name'] for col in meta['columns']], copy=False)
+            df.attrs['decimals'] = decimals
+        except (OSError, ValueError, KeyError):
+            # 缓存损坏时当作未命中，重新解析
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            return None
+        # 更新修改时间作为最近使用时间
+        os.utime(meta_path)
+        return df
+
+    def store(self, key: str, df: pd.DataFrame):
+        # 列名不是字符串（如 Excel 里的数字、日期表头）时存进 meta.json 会变样，不缓存
+        if not all(isinstance(name, str) for name in df.columns):
+            return
+        tmp_dir = self.entry_dir(key) + f'.tmp{os.getpid()}'
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            columns = []
+            for i, name in enumerate(df.columns):
+                series = df[name]
+                dtype = series.dtype
+                if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+                    file_name = f'c{i}.npy'
+                    np.save(os.path.join(tmp_dir, file_name), series.to_numpy())
+                    kind = 'npy'
+                else:
+                    file_name = f'c{i}.pkl'
+                    series.reset_index(drop=True).to_pickle(os.path.join(tmp_dir, file_name))
+                    kind = 'pickle'
+                columns.append({'name': name, 'file': file_name, 'kind': kind,
+                                'decimals': df.attrs.get('decimals', {}).get(name)})
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'rows': len(df), 'columns': columns}, f, ensure_ascii=False)
+            if os.path.exists(self.entry_dir(key)):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            else:
+                os.replace(tmp_dir, self.entry_dir(key))
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def time_index_path(self, key: str, field) -> str:
+        # field 为列名或列名元组（合并的“日期”“时间”），按 JSON 区分，两者不会重名
+        name = hashlib.sha1(json.dumps(field, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.entry_dir(key), f'time_{name}.npy')
+
+    def load_time_index(self, key: str, field) -> np.ndarray:
+        path = self.time_index_path(key, field)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def store_time_index(self, key: str, field, ts: np.ndarray):
+        if not os.path.isdir(self.entry_dir(key)):
+            return
+        try:
+            np.save(self.time_index_path(key, field), ts)
+        except OSError:
+            pass
+
+    def evict(self):
+        # 按最近使用时间从旧到新删除，直到总大小不超过上限
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta_path), size, entry))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        pass
+
+
+class SessionDataset:
+    # 会话级数据集：文件只解析一次，所有处理操作共享同一份数据，
+    # 只有磁盘上的文件发生变化（大小或修改时间）时才重新解析。
+    # 处理得到的派生列先保存在内存中，按需（或退出时）一次性写入源文件旁的
+    # 边车文件（<源文件>.derived.parquet），不再改写用户的源文件
+    def __init__(self):
+        self.path: str = ''
+        self.signature: tuple = None
+        # 实时跟踪追加数据用的缓冲区（见 grow_buffer），键为 ('col'/'derived'/'time'/'labels', 名称)
+        self.buffers: Dict[tuple, np.ndarray] = {}
+        self.df = None
+        # float32 列的小数位数（见 compact_frame），转回 float64 时据此取整
+        self.decimals: Dict[str, int] = {}
+        # 派生列：列名 -> float64 数组
+        self.derived: Dict[str, np.ndarray] = {}
+        self.dirty: bool = False
+        self._frame: pd.DataFrame = None
+        self._time_cache: Dict[str, tuple] = {}
+        self.sidecar_dir: str = ''
+        # 读 CSV 时除数值列外还需要保留的列（横坐标、日期、时间）
+        self.keep_columns: tuple = TIME_COLUMNS
+        # 解析结果的持久化缓存，设为 None 时不使用
+        self.file_cache: ParsedFileCache = ParsedFileCache()
+        self.cache_key: str = None
+        # 派生列的来源：派生列名 -> (源列, 操作, 参数, 横坐标字段)，实时跟踪时据此增量计算
+        self.sources: Dict[str, tuple] = {}
+        self.running_state: Dict[str, object] = {}
+        # 实时跟踪文件时新数据由 append_rows 追加，文件变化不再触发整体重新加载
+        self.following: bool = False
+        # 源数据每次加载或追加后加一，处理结果缓存以此区分新旧数据
+        self.version: int = 0
+        # 因源文件已修改而没有载入的边车文件
+        self.stale_sidecar: str = ''
+
+    @property
+    def df(self) -> pd.DataFrame:
+        # 源数据表。实时跟踪追加过数据后各列保存在缓冲区中，用到整个表时才重新组装（不复制数值列）
+        if self._df is None and self.arrays:
+            data = {}
+            for col, values in self.arrays.items():
+                dtype = self.dtypes[col]
+                if isinstance(dtype, pd.CategoricalDtype):
+                    data[col] = pd.Categorical.from_codes(values, dtype=dtype)
+                else:
+                    data[col] = values
+            self._df = pd.DataFrame(data, copy=False)
+        return self._df
+
+    @df.setter
+    def df(self, df: pd.DataFrame):
+        self._df = df
+        # 各列的数组（分类列为编码）和类型，第一次追加数据时才从表中取出
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.dtypes: Dict[str, object] = {}
+        self.buffers = {key: buf for key, buf in self.buffers.items() if key[0] != 'col'}
+        self.n_rows = 0 if df is None else len(df)
+
+    @property
+    def columns(self) -> list:
+        # 源数据的列名，不需要组装整个表
+        if self.arrays:
+            return list(self.arrays)
+        return [] if self._df is None else list(self._df.columns)
+
+    @staticmethod
+    def file_signature(path: str) -> tuple:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+
+    def parse(self, path: str) -> pd.DataFrame:
+        # 解析文件并压缩数据类型，记录节省的内存
+        df = read_table(path, self.keep_columns)
+        with STAGES.stage('compact', rows=len(df)) as record:
+            df, before, after = compact_frame(df, self.keep_columns)
+            record['before_mb'] = round(before / 2 ** 20, 1)
+            record['after_mb'] = round(after / 2 ** 20, 1)
+            record['saved_mb'] = round((before - after) / 2 ** 20, 1)
+        return df
+
+    def file_key(self, path: str) -> str:
+        # 解析缓存的键（要读取文件内容计算哈希），每次打开只算一次，传给 read 和 load
+        if self.file_cache is None:
+            return None
+        return self.file_cache.key(path, self.keep_columns)
+
+    def read(self, path: str, key: str = None) -> pd.DataFrame:
+        # 优先读取解析缓存，未命中时解析文件并写入缓存（缓存的是压缩后的数据）
+        if self.file_cache is None:
+            return self.parse(path)
+        key = key or self.file_key(path)
+        df = self.file_cache.load(key)
+        if df is None:
+            df = self.parse(path)
+            self.file_cache.store(key, df)
+        return df
+
+    def load(self, path: str, df: pd.DataFrame = None, key: str = None):
+        # df 已经解析过时直接接管，避免重复读取
+        key = key or self.file_key(path)
+        if df is None:
+            df = self.read(path, key)
+        self.cache_key = key
+        self.path = path
+        self.signature = self.file_signature(path)
+        self.buffers = {}
+        self.df = df
+        self.decimals = dict(df.attrs.get('decimals', {}))
+        self.derived = {}
+        self.sources = {}
+        self.running_state = {}
+        self.version += 1
+        self.dirty = False
+        self._frame = None
+        self._time_cache = {}
+        self.stale_sidecar = ''
+        self.load_sidecar()
+        pass
+
+    def is_stale(self) -> bool:
+        if self.following or not self.path or not os.path.exists(self.path):
+            return False
+        return self.file_signature(self.path) != self.signature
+
+    def reload(self):
+        # 文件在磁盘上变化后重新加载；先把未写出的派生列写入边车文件，不会被悄悄丢掉。
+        # 这些结果对应的是修改前的数据，重新加载后不会再载入（见 load_sidecar）
+        self.flush()
+        self.load(self.path)
+
+    def frame(self) -> pd.DataFrame:
+        # 返回源数据列 + 派生列；派生列变化时才重新拼接
+        if self.is_stale():
+            self.reload()
+        if self.df is None:
+            return None
+        if self._frame is None:
+            if self.derived:
+                base = self.df.drop(columns=[c for c in self.derived if c in self.df.columns])
+                self._frame = pd.concat([base, pd.DataFrame(self.derived, index=self.df.index)], axis=1)
+            else:
+                self._frame = self.df
+        return self._frame
+
+    def time_index(self, field) -> tuple:
+        # 返回 (datetime64[ns] 数组, 横坐标标签数组)，同一文件同一字段只解析一次；
+        # field 为 TIME_COLUMNS 时合并“日期”“时间”两列。文件变化重新加载时缓存随之清空
+        if self.is_stale():
+            self.reload()
+        if field not in self._time_cache:
+            df = self.frame()
+            ts = None
+            if self.file_cache is not None and self.cache_key:
+                ts = self.file_cache.load_time_index(self.cache_key, field)
+            if ts is None or len(ts) != len(df):
+                with STAGES.stage('parse', rows=len(df), field=field):
+                    ts = parse_time_index(df[field]) if field in df.columns else frame_timestamp(df, field)
+                if self.file_cache is not None and self.cache_key:
+                    self.file_cache.store_time_index(self.cache_key, field, ts)
+            labels = np.datetime_as_string(ts, unit='D')
+            self._time_cache[field] = (ts, labels)
+        return self._time_cache[field]
+
+    def timestamps(self, x_field: str) -> np.ndarray:
+        # 完整时间戳：有“日期”和“时间”两列时合并两列，否则就是横坐标字段；同样按文件缓存。
+        # 合并的时间戳以列名元组为键，不会和真实的列名冲突
+        columns = self.columns
+        field = TIME_COLUMNS if all(c in columns for c in TIME_COLUMNS) else x_field
+        return self.time_index(field)[0]
+
+    def add_derived(self, name: str, values, source: tuple = None):
+        # 按行索引对齐；只覆盖部分行的结果（如每日/每小时首条记录）其余行为NaN
+        if isinstance(values, pd.Series):
+            values = values.reindex(self.df.index)
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) != self.n_rows:
+            raise ValueError(f'{name} 的行数 {len(values)} 与数据行数 {self.n_rows} 不一致')
+        self.derived[name] = values
+        self.running_state.pop(name, None)
+        if source is not None:
+            self.sources[name] = source
+        else:
+            self.sources.pop(name, None)
+        self.dirty = True
+        self._frame = None
+        pass
+
+    def result_key(self, name: str, op: str, params: dict, x_field: str) -> tuple:
+        # 对 name 列执行 op 的结果缓存键：沿派生列来源追溯到原始列，得到完整处理链；
+        # 来源不明（如从边车文件读入）的派生列不缓存，返回 None
+        chain = [ResultCache.stage(op, params)]
+        while name in self.sources:
+            name, source_op, source_params, _ = self.sources[name]
+            chain.append(ResultCache.stage(source_op, source_params))
+        if name in self.derived or name not in self.columns:
+            return None
+        return (self.path, self.version, x_field, name, tuple(reversed(chain)))
+
+    def values(self, name: str, start: int = 0) -> np.ndarray:
+        # 单列从 start 行开始的数据，不拼接整个表、不转换类型；实时跟踪时是缓冲区的视图
+        if name in self.derived:
+            return self.derived[name][start:]
+        if name in self.arrays and not isinstance(self.dtypes[name], pd.CategoricalDtype):
+            return self.arrays[name][start:]
+        return self.df[name].to_numpy()[start:]
+
+    def column(self, name: str, start: int = 0) -> np.ndarray:
+        return widen_float32(self.values(name, start), self.decimals.get(name))
+
+    def has_column(self, name: str) -> bool:
+        return name in self.derived or name in self.columns
+
+    def take_arrays(self):
+        # 第一次追加数据前把各列取成数组，之后各列在缓冲区中增长
+        for col in self._df.columns:
+            series = self._df[col]
+            dtype = series.dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                values = series.cat.codes.to_numpy()
+            elif isinstance(dtype, np.dtype):
+                values = series.to_numpy()
+            else:
+                values = series.to_numpy(dtype=object)
+                dtype = values.dtype
+            self.arrays[col] = values
+            self.dtypes[col] = dtype
+
+    def append_rows(self, new_df: pd.DataFrame) -> int:
+        # 实时跟踪：追加新行，已缓存的时间索引只解析新行，可增量计算的派生列只计算新行，
+        # 其余派生列（依赖整列统计量或之后数据的）新行为NaN，需要重新处理。返回原有行数。
+        # 各列、时间索引、派生列都在缓冲区中原地增长，每次的代价只与新行数有关
+        n_old = self.n_rows
+        n_new = n_old + len(new_df)
+        # 文件内容已变，旧的解析缓存不再对应
+        self.cache_key = None
+        if not self.arrays:
+            self.take_arrays()
+        new_df = new_df.reindex(columns=self.columns).reset_index(drop=True)
+        for col in self.columns:
+            # 新行转换成与已有数据相同的（压缩后的）类型，不会把整列升级
+            dtype = self.dtypes[col]
+            raw = new_df[col]
+            if isinstance(dtype, pd.CategoricalDtype):
+                # 新出现的类别加在末尾，已有的编码不变
+                added = pd.Index(raw.dropna().unique()).difference(dtype.categories)
+                if len(added):
+                    dtype = self.dtypes[col] = pd.CategoricalDtype(dtype.categories.append(added))
+                values = pd.Categorical(raw, dtype=dtype).codes
+            elif dtype.kind == 'M':
+                values = parse_time_index(raw)
+            elif dtype.kind in 'biuf':
+                values = pd.to_numeric(raw, errors='coerce').to_numpy()
+                if dtype == np.float32 and col in self.decimals:
+                    places = float32_decimals(values.astype(np.float64))
+                    if places is not None and places <= self.decimals[col]:
+                        values = values.astype(np.float32)
+                    else:
+                        # 新数据的小数位数更多，float32 不能无损保存，整列改为 float64（只发生一次）
+                        self.arrays[col] = self.column(col)
+                        self.buffers.pop(('col', col), None)
+                        del self.decimals[col]
+                elif dtype.kind == 'f':
+                    values = values.astype(dtype)
+            else:
+                values = raw.to_numpy(dtype=object)
+            self.arrays[col] = grow_buffer(self.buffers, ('col', col), self.arrays[col], values)
+            if not isinstance(dtype, pd.CategoricalDtype):
+                self.dtypes[col] = self.arrays[col].dtype
+        self.n_rows = n_new
+        self._df = None
+        for field, (ts, labels) in list(self._time_cache.items()):
+            new_ts = parse_time_index(new_df[field]) if field in new_df.columns else frame_timestamp(new_df, field)
+            self._time_cache[field] = (
+                grow_buffer(self.buffers, ('time', field), ts, new_ts),
+                grow_buffer(self.buffers, ('labels', field), labels, np.datetime_as_string(new_ts, unit='D')))
+        # 按创建顺序更新，由派生列再派生的列能用到源列刚算出的新值
+        for name in list(self.derived):
+            values = np.full(len(new_df), np.nan)
+            source = self.sources.get(name)
+            if source is not None and source[1] in RUNNING_OPERATIONS:
+                col, op, params, x_field = source
+                # 源列已被删除或还没有追加新行时不计算
+                if self.has_column(col) and len(self.values(col)) == n_new:
+                    if op == 'online' and name not in self.running_state:
+                        # 在线检测器用已有数据预热，之后只保留固定长度的窗口
+                        self.running_state[name] = OnlineOutlierDetector(1, **params)
+                        self.running_state[name].update(self.column(col)[:n_old, None])
+                    ts = self.timestamps(x_field) if op == 'rate' else None
+                    # 只取增量计算需要的历史行和新行
+                    start = running_start(op, params, ts, n_old)
+                    values = extend_running(op, params, self.column(col, start)[:, None],
+                                            None if ts is None else ts[start:], n_old - start,
+                                            self.running_state.get(name))[:, 0]
+            self.derived[name] = grow_buffer(self.buffers, ('derived', name), self.derived[name], values)
+        self.signature = self.file_signature(self.path)
+        self.version += 1
+        self.dirty = self.dirty or bool(self.derived)
+        self._frame = None
+        return n_old
+
+    def drop_column(self, name: str):
+        # 只在会话中删除，不改写源文件
+        if name in self.derived:
+            del self.derived[name]
+            self.sources.pop(name, None)
+            self.running_state.pop(name, None)
+            self.dirty = True
+        elif name in self.columns:
+            self.df = self.df.drop(columns=[name])
+        else:
+            return False
+        self._frame = None
+        return True
+
+    def sidecar_path(self, ext: str = '.parquet') -> str:
+        # 默认写在源文件旁边；批处理时可以指定输出目录
+        if self.sidecar_dir:
+            return os.path.join(self.sidecar_dir, os.path.basename(self.path) + '.derived' + ext)
+        return self.path + '.derived' + ext
+
+    def load_sidecar(self):
+        for ext in ('.parquet', '.pkl'):
+            sidecar = self.sidecar_path(ext)
+            if not os.path.exists(sidecar):
+                continue
+            if ext == '.parquet':
+                side_df = pd.read_parquet(sidecar)
+            else:
+                side_df = pd.read_pickle(sidecar)
+            # 源文件修改过（大小、修改时间与写出边车文件时的不同）或行数变化后，
+            # 旧的派生结果不再对应，不载入，记下路径由界面提示
+            source = side_df.attrs.get('source', {})
+            if [source.get('size'), source.get('mtime_ns')] != list(self.signature) or len(side_df) != self.n_rows:
+                self.stale_sidecar = sidecar
+                return
+            for col in side_df.columns:
+                self.derived[col] = side_df[col].to_numpy(dtype=np.float64)
+            return
+        pass
+
+    def flush(self):
+        # 所有派生列一次性写入边车文件
+        if not self.dirty or not self.path:
+            return None
+        side_df = pd.DataFrame(self.derived, index=self.df.index).reset_index(drop=True)
+        # 记录派生列所依据的源文件版本（加载或追加时的大小、修改时间），文件之后再被修改时不会误用
+        side_df.attrs['source'] = {'size': self.signature[0], 'mtime_ns': self.signature[1]}
+        try:
+            sidecar = self.sidecar_path('.parquet')
+            side_df.to_parquet(sidecar, index=False)
+        except ImportError:
+            # 没有安装 pyarrow/fastparquet 时退回 pickle
+            sidecar = self.sidecar_path('.pkl')
+            side_df.to_pickle(sidecar)
+        self.dirty = False
+        return sidecar
+
+    def export_excel(self, path: str):
+        # float32 列按记录的小数位数转回 float64，导出的数值与源文件一致（如 5000.12 而不是 5000.1201171875）
+        df = self.frame()
+        float32_columns = [col for col in df.columns if df[col].dtype == np.float32]
+        if float32_columns:
+            df = df.assign(**{col: self.column(col) for col in float32_columns})
+        df.to_excel(path, index=False)
+        pass
+
+
+class OverlayFile:
+    # 叠加对比用的附加文件：打开时只读表头和时间列，绘图用到的列才读取；
+    # 按主文件的时间做 as-of 对齐（取不晚于该时刻的最近一条记录），不与主文件拼接成一个表
+    def __init__(self, path: str, x_field: str):
+        self.path = path
+        self.loaded: Dict[str, np.ndarray] = {}
+        # 不能写入解析缓存的 Excel（如表头不是字符串）只能保留整个表
+        self.frame: pd.DataFrame = None
+        # Excel 解析后 float32 列的小数位数；CSV 按列直接读成 float64，不需要
+        self.decimals: Dict[str, int] = {}
+        if path.endswith('.csv'):
+            self.encoding = detect_encoding(path)
+            self.columns = list(pd.read_csv(path, nrows=0, encoding=self.encoding).columns)
+        else:
+            # Excel 只能整表解析：解析一次写入解析缓存后不保留，各列用到时才从缓存映射
+            self.dataset = SessionDataset()
+            self.dataset.keep_columns = (x_field,) + TIME_COLUMNS
+            self.cache_key = self.dataset.file_key(path)
+            frame = self.dataset.read(path, self.cache_key)
+            self.decimals = frame.attrs.get('decimals', {})
+            self.columns = list(frame.columns)
+            if self.dataset.file_cache.load(self.cache_key, []) is None:
+                self.frame = frame
+        time_columns = list(TIME_COLUMNS) if all(c in self.columns for c in TIME_COLUMNS) else [x_field]
+        if any(c not in self.columns for c in time_columns):
+            raise ValueError(f'{os.path.basename(path)} 中没有横坐标字段 {x_field}')
+        ts = frame_timestamp(self.read_columns(time_columns), x_field)
+        valid = np.flatnonzero(~np.isnat(ts))
+        self.order = valid[np.argsort(ts[valid], kind='stable')]
+        self.sorted_ts = ts[self.order]
+        self.value_columns = [c for c in self.columns if c not in time_columns and c != x_field]
+
+    def read_columns(self, columns: list) -> pd.DataFrame:
+        if self.frame is not None:
+            return self.frame[columns]
+        if self.path.endswith('.csv'):
+            return pd.read_csv(self.path, usecols=columns, encoding=self.encoding, low_memory=False)[columns]
+        df = self.dataset.file_cache.load(self.cache_key, columns)
+        if df is None:
+            # 缓存已被淘汰，重新解析并写回缓存
+            df = self.dataset.read(self.path, self.cache_key)
+        return df[columns]
+
+    def load(self, names: list):
+        # 还没读过的列一次读出（CSV 只扫描一遍文件），按时间排序后缓存起来
+        missing = [name for name in dict.fromkeys(names) if name not in self.loaded]
+        if not missing:
+            return
+        df = self.read_columns(missing)
+        for name in missing:
+            values = pd.to_numeric(df[name], errors='coerce').to_numpy()
+            self.loaded[name] = widen_float32(values, self.decimals.get(name))[self.order]
+
+    def column(self, name: str) -> np.ndarray:
+        self.load([name])
+        return self.loaded[name]
+
+    def median_step(self) -> np.timedelta64:
+        if len(self.sorted_ts) < 2:
+            return np.timedelta64(0, 'ns')
+        return np.median(np.diff(self.sorted_ts))
+
+    def aligned(self, name: str, ts: np.ndarray, tolerance: np.timedelta64 = None) -> np.ndarray:
+        # 每个目标时刻取不晚于它的最近一条记录，相差超过容差（默认为采样间隔的 2 倍）时为NaN
+        if tolerance is None:
+            tolerance = 2 * self.median_step()
+        values = self.column(name)
+        idx = np.searchsorted(self.sorted_ts, ts, 'right') - 1
+        ok = (idx >= 0) & ~np.isnat(ts)
+        idx = np.maximum(idx, 0)
+        ok &= (ts - self.sorted_ts[idx]) <= tolerance
+        return np.where(ok, values[idx], np.nan)
+
+
+def parse_pipeline(spec: str) -> list:
+    # 处理链：JSON 文件 [{"op": "impute", "params": {"window": 4}}, ...]，
+    # 或者命令行字符串 "impute:window=4,lof,moving_average:window=3,rate"
+    # 操作名、参数名不对时抛出 ValueError，批处理在开始前报错
+    if os.path.isfile(spec):
+        try:
+            with open(spec, encoding='utf-8') as f:
+                steps = [(step['op'], step.get('params', {})) for step in json.load(f)]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f'处理链文件 {spec} 格式不对，应为 [{{"op": ..., "params": {{...}}}}, ...]: {e}')
+    else:
+        steps = []
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            op, _, param_str = item.partition(':')
+            params = {}
+            for pair in param_str.split(';') if param_str else []:
+                key, eq, value = pair.partition('=')
+                if not eq or not key.strip():
+                    raise ValueError(f'参数应写成 名称=值: {op.strip()}:{pair}')
+                try:
+                    params[key.strip()] = json.loads(value)
+                except ValueError:
+                    # 不是 JSON 的值按字符串处理，如 rate:interval=10min
+                    params[key.strip()] = value.strip()
+            steps.append((op.strip(), params))
+    if not steps:
+        raise ValueError('处理链为空')
+    for op, params in steps:
+        if op not in OPERATIONS:
+            raise ValueError(f"未知的处理操作: {op}，可选: {', '.join(OPERATIONS)}")
+        # 时间戳、分组键由批处理按文件提供，取消标志由界面提供，不能在处理链里指定
+        parameters = list(inspect.signature(OPERATIONS[op][1]).parameters.values())[1:]
+        allowed = [p.name for p in parameters if p.kind != p.VAR_KEYWORD and p.name not in ('timestamp', 'keys', 'cancel')]
+        any_name = any(p.kind == p.VAR_KEYWORD for p in parameters)
+        unknown = [name for name in params if name not in allowed and not any_name]
+        if unknown:
+            raise ValueError(f"{op} 没有参数 {', '.join(unknown)}，可选: {', '.join(allowed) or '无'}")
+    return steps
+
+
+def pipeline_arg(spec: str) -> list:
+    # argparse 的 type：处理链有误时由 argparse 报错并显示用法，而不是抛出异常
+    try:
+        return parse_pipeline(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_pipeline(dataset: SessionDataset, columns: list, steps: list, x_field: str,
+                 timings: dict = None) -> Dict[str, np.ndarray]:
+    # 依次执行处理链，每一步以上一步的输出为输入；返回 派生列名 -> 数据
+    derived = {}
+    names = list(columns)
+    df = dataset.frame()
+    values = np.column_stack([dataset.column(col) for col in columns])
+    for op, params in steps:
+        start = time.perf_counter()
+        suffix, func = OPERATIONS[op]
+        values = func(values, **params, **operation_context(op, df, x_field))
+        names = [name + suffix for name in names]
+        for k, name in enumerate(names):
+            derived[name] = values[:, k]
+        if timings is not None:
+            timings[f'{op}_s'] = time.perf_counter() - start
+    return derived
+
+
+def process_file(path: str, steps: list, columns: list, x_field: str, out_dir: str) -> dict:
+    # 批处理单个文件：读取 -> 处理链 -> 写出派生列边车文件，返回各阶段耗时
+    timings = {'file': path}
+    total_start = time.perf_counter()
+    try:
+        start = time.perf_counter()
+        dataset = SessionDataset()
+        dataset.sidecar_dir = out_dir
+        dataset.keep_columns = (x_field,) + TIME_COLUMNS
+        # 批处理每个文件只处理一次，不写解析缓存
+        dataset.file_cache = None
+        dataset.load(path)
+        df = dataset.frame()
+        timings['rows'] = len(df)
+        timings['load_s'] = time.perf_counter() - start
+
+        if not columns:
+            columns = [col for col in dataset.df.columns
+                       if col != x_field and pd.api.types.is_numeric_dtype(df[col].dtype)]
+        derived = run_pipeline(dataset, columns, steps, x_field, timings)
+
+        start = time.perf_counter()
+        for name, values in derived.items():
+            dataset.add_derived(name, values)
+        timings['output'] = dataset.flush()
+        timings['write_s'] = time.perf_counter() - start
+        timings['status'] = 'ok'
+    except Exception as e:
+        timings['status'] = f'error: {e}'
+    timings['total_s'] = time.perf_counter() - total_start
+    return timings
+
+
+def batch_main(argv: list) -> int:
+    # 无界面批处理：python analysis.py batch "data/*.xlsx" --pipeline impute,lof,moving_average,rate
+    parser = argparse.ArgumentParser(prog='analysis.py batch', description='批量处理记录仪数据文件')
+    parser.add_argument('pattern', help='文件通配符，如 "data/*.xlsx"')
+    parser.add_argument('--pipeline', required=True, type=pipeline_arg,
+                        help='处理链，如 "impute:window=4,lof:n_neighbors=20,moving_average:window=3,rate"，或 JSON 文件路径')
+    parser.add_argument('--columns', default='', help='要处理的列，逗号分隔；默认处理所有数值列')
+    parser.add_argument('--x', dest='x_field', default='日期', help='横坐标字段')
+    parser.add_argument('--out', default='', help='输出目录，按输入文件的相对路径建子目录；默认写在源文件旁边')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='并行进程数')
+    args = parser.parse_args(argv)
+
+    steps = args.pipeline
+    columns = [col.strip() for col in args.columns.split(',') if col.strip()]
+    paths = sorted(glob.glob(args.pattern, recursive=True))
+    if not paths:
+        print(f'没有匹配的文件: {args.pattern}')
+        return 1
+    # 不同目录下的同名文件输出不会互相覆盖：输出目录下保留各文件相对于共同上级目录的路径
+    out_dirs = {path: '' for path in paths}
+    if args.out:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+        for path in paths:
+            rel = os.path.relpath(os.path.dirname(os.path.abspath(path)), root)
+            out_dirs[path] = os.path.normpath(os.path.join(args.out, rel))
+            os.makedirs(out_dirs[path], exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(process_file, path, steps, columns, args.x_field, out_dirs[path])
+                   for path in paths]
+        for future in as_completed(futures):
+            timings = future.result()
+            rows.append(timings)
+            print(f"{timings['status']:>6}  {timings['total_s']:8.2f}s  {timings['file']}")
+
+    summary = pd.DataFrame(rows).sort_values('file')
+    summary_path = os.path.join(args.out or '.', 'batch_timing.csv')
+    summary.to_csv(summary_path, index=False, encoding='utf-8-sig')
+    print(f'耗时汇总已写入 {summary_path}')
+    return 0 if all(row['status'] == 'ok' for row in rows) else 1
+
+
+class WorkerSignals(QtCore.QObject):
+    # 后台任务通过信号把进度和结果送回界面线程
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+    error = QtCore.pyqtSignal(str)
+
+
+class StageSignals(QtCore.QObject):
+    # 阶段记录可能在后台线程完成，通过信号转到界面线程显示
+    recorded = QtCore.pyqtSignal(object)
+
+
+class OperationJob(QtCore.QRunnable):
+    # 在 QThreadPool 中执行一个处理操作：所有列作为一个二维数组一次计算，
+    # 按时间分组的操作（蒸腾速率等）只排序、分组一次；可以并行的计算（LOF）在计算函数内部按列并行
+    def __init__(self, func, values: np.ndarray, params: dict):
+        super().__init__()
+        self.func = func
+        self.values = values
+        self.params = params
+        self.signals = WorkerSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        # 耗时较长的计算函数（接受 cancel 参数的）在下一个检查点退出，其余的算完后丢弃结果
+        self.cancel_event.set()
+
+    def run(self):
+        params = dict(self.params)
+        if 'cancel' in inspect.signature(self.func).parameters:
+            params['cancel'] = self.cancel_event
+        try:
+            # 不知道计算进度，进度条显示为忙碌状态
+            self.signals.progress.emit(0, 0)
+            with STAGES.stage('compute', rows=len(self.values), op=self.func.__name__,
+                              columns=self.values.shape[1]):
+                result = self.func(self.values, **params)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.error.emit(str(e))
+            return
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit()
+            return
+        self.signals.finished.emit(result)
+
 
 class RotateAxisItem(pg.AxisItem):
+    # 横坐标是采样点序号，刻度文字取对应的标签。刻度按当前可见范围和像素宽度生成，
+    # 可见的刻度数只与坐标轴宽度有关，与数据长度无关
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.labels: np.ndarray = None
+        self.label_cache: Dict[int, str] = {}
+        self.label_px: float = 0
+
+    def set_labels(self, labels: np.ndarray):
+        self.labels = labels
+        self.label_cache = {}
+        self.label_px = 0
+        self.picture = None
+        self.update()
+
+    def label_width(self) -> float:
+        # 旋转 30 度后一个标签在水平方向占的像素，加上间距；按首尾标签估计
+        if not self.label_px:
+            metrics = QtGui.QFontMetrics(self.style['tickFont'] or self.font())
+            width = max(metrics.horizontalAdvance(str(self.labels[k])) for k in (0, -1))
+            self.label_px = width * math.cos(math.radians(30)) + metrics.height() * math.sin(math.radians(30)) + 12
+        return self.label_px
+
+    def tickValues(self, minVal, maxVal, size):
+        if self.labels is None or len(self.labels) == 0:
+            return super().tickValues(minVal, maxVal, size)
+        lo = max(math.ceil(minVal), 0)
+        hi = min(math.floor(maxVal), len(self.labels) - 1)
+        if hi < lo:
+            return []
+        # 按像素宽度能放下的标签数确定间隔，间隔取 1、2、5×10^k 序列，缩放时刻度位置稳定
+        max_ticks = max(int(size / self.label_width()), 1)
+        raw = max((maxVal - minVal) / max_ticks, 1)
+        magnitude = 10 ** math.floor(math.log10(raw))
+        step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw)
+        start = math.ceil(lo / step) * step
+        return [(step, list(np.arange(start, hi + 1, step, dtype=np.float64)))]
+
+    def tickStrings(self, values, scale, spacing):
+        if self.labels is None:
+            return super().tickStrings(values, scale, spacing)
+        strings = []
+        for v in values:
+            k = int(v)
+            text = self.label_cache.get(k)
+            if text is None:
+                if len(self.label_cache) > 10000:
+                    self.label_cache = {}
+                text = self.label_cache[k] = str(self.labels[k])
+            strings.append(text)
+        return strings
+
     def drawPicture(self, p, axisSpec, tickSpecs, textSpecs):
         p.setRenderHint(p.Antialiasing,False)
         p.setRenderHint(p.TextAntialiasing,True)
@@ -35,14 +1863,15 @@ class RotateAxisItem(pg.AxisItem):
         # if self.tickFont is not None:
         #     p.setFont(self.tickFont)
         p.setPen(self.pen())
+        # 每个标签从同一个基准变换出发平移、旋转，整个循环只保存/恢复一次画笔状态
+        p.save()
+        base = p.transform()
         for rect,flags,text in textSpecs:
-            # this is the important part
-            p.save()
+            p.setTransform(base)
             p.translate(rect.x(),rect.y())
             p.rotate(-30)
             p.drawText(int(-rect.width()),int(rect.height()),int(rect.width()),int(rect.height()),flags,text)
-            # restoring the painter is *required*!!!
-            p.restore()
+        p.restore()
 
 
 class GraphWidget(QtWidgets.QWidget):
@@ -53,10 +1882,21 @@ class GraphWidget(QtWidgets.QWidget):
         self.target_color_list = []  # 初始化target_color_list属性
     def init_data(self):
         self.whole_data: Dict = None
-        self.whole_xtick: list = []
-        self.whole_x: list = []
+        self.whole_xtick: np.ndarray = None
+        self.whole_x: np.ndarray = None
+        self.x_Tick: np.ndarray = []
+        self.y_data: list = []
+        self.y_names: list = []
+        self.plots: Dict = {}
+        self.series: Dict = {}
+        # 各折线的最小/最大值金字塔，平移、缩放时按可见范围取点，不再扫描原始数据
+        self.pyramids: Dict[str, MinMaxPyramid] = {}
+        self.outlier_items: Dict = {}
+        # 实时追加数据用的缓冲区（容量按 2 倍增长），series 等保存的是其中已用部分的视图
+        self.buffers: Dict = {}
+        self.tooltip_prefix: list = []
+        self.hover_index: int = None
         self.color_line = (30, 144, 255)
-        self.cur_len = 20
         # 最多20条
         self.color_map = {
             '道奇蓝': (30, 144, 255),
@@ -90,6 +1930,8 @@ class GraphWidget(QtWidgets.QWidget):
 
         check_btn = QtWidgets.QPushButton('确定')
         check_btn.clicked.connect(self.check_btn_clicked)
+        # 勾选后拖动滑块即时应用范围
+        self.live_checkbox = QtWidgets.QCheckBox('实时')
 
         layout_top = QtWidgets.QHBoxLayout()
         layout_top.addWidget(self.duration_label)
@@ -98,6 +1940,7 @@ class GraphWidget(QtWidgets.QWidget):
         layout_top.addWidget(self.right_slider)
         layout_top.addWidget(self.right_label)
         layout_top.addWidget(check_btn)
+        layout_top.addWidget(self.live_checkbox)
         # layout_top.addStretch(1)
 
         xax = RotateAxisItem(orientation='bottom')
@@ -107,6 +1950,25 @@ class GraphWidget(QtWidgets.QWidget):
         # self.pw.enableAutoRange(x=False,y=True)
         self.pw.setAutoVisible(x=False, y=True)
 
+        # 视图范围变化后按当前可见范围重新抽稀，合并短时间内的多次变化
+        self.decimate_timer = QtCore.QTimer(self)
+        self.decimate_timer.setSingleShot(True)
+        self.decimate_timer.setInterval(30)
+        self.decimate_timer.timeout.connect(self.update_decimation)
+        self.pw.getViewBox().sigXRangeChanged.connect(self.decimate_timer.start)
+        self.pw.getViewBox().sigResized.connect(self.decimate_timer.start)
+
+        # 图例、十字线、提示框和鼠标信号代理每个控件只创建一次
+        self.pw.addLegend()
+        self.vLine = pg.InfiniteLine(angle=90, movable=False)
+        self.hLine = pg.InfiniteLine(angle=0, movable=False)
+        self.label = pg.TextItem()
+        self.pw.addItem(self.vLine, ignoreBounds=True)
+        self.pw.addItem(self.hLine, ignoreBounds=True)
+        self.pw.addItem(self.label, ignoreBounds=True)
+        self.vb = self.pw.getViewBox()
+        self.proxy = pg.SignalProxy(self.pw.scene().sigMouseMoved, rateLimit=60, slot=self.mouseMoved)
+
         layout = QtWidgets.QVBoxLayout()
         layout.addLayout(layout_top)
         layout.addWidget(self.pw)
@@ -117,12 +1979,18 @@ class GraphWidget(QtWidgets.QWidget):
         self.whole_data = data
         self.whole_x = data['x']
         self.whole_xtick = data['xTick']
+        last_index = len(self.whole_x) - 1
+        # 设置滑块时不触发实时范围更新
+        self.left_slider.blockSignals(True)
+        self.right_slider.blockSignals(True)
         self.left_slider.setMinimum(0)
-        self.left_slider.setMaximum(self.whole_x[-1])
+        self.left_slider.setMaximum(last_index)
         self.right_slider.setMinimum(0)
-        self.right_slider.setMaximum(self.whole_x[-1])
+        self.right_slider.setMaximum(last_index)
         self.left_slider.setValue(0)
-        self.right_slider.setValue(self.whole_x[-1])
+        self.right_slider.setValue(last_index)
+        self.left_slider.blockSignals(False)
+        self.right_slider.blockSignals(False)
         self.left_label.setText(f"左边:{self.whole_xtick[0]}")
         self.right_label.setText(f"{self.whole_xtick[-1]}:右边")
 
@@ -130,20 +1998,14 @@ class GraphWidget(QtWidgets.QWidget):
         pass
 
     def set_data(self, data: Dict):
-        self.pw.clear()
-        self.pw.addLegend()
-        xTick = [data['xTick00']]
         x = data['x']
         y_list = data['y_list']
         y_names = data['y_names']
 
         self.x_Tick = data['xTick']
+        self.pw.getAxis('bottom').set_labels(self.x_Tick)
         self.y_data = y_list
         self.y_names = y_names
-        self.duration_label.setText(f"{self.x_Tick[0]}~{self.x_Tick[-1]}")
-
-        xax = self.pw.getAxis('bottom')
-        xax.setTicks(xTick)
 
         # 更新 target_color_list
         self.target_color_list = []
@@ -153,71 +2015,209 @@ class GraphWidget(QtWidgets.QWidget):
             t_key = color_keys_list[t_i]
             self.target_color_list.append(t_key)
 
-        self.plots = {}
+        # 已有的折线原地 setData，新增的才创建，不再选中的移除；不清空整个场景
+        for name in list(self.plots):
+            if name not in y_names:
+                self.remove_plot(name)
+        # 保留完整数据，实际绘制的是按可见范围抽稀后的数据
+        x_arr = np.asarray(x, dtype=float)
+        n_buckets = self.decimate_buckets()
         for i, (y, name) in enumerate(zip(y_list, y_names)):
-            plot = self.pw.plot(x, y, connect='finite', pen=pg.mkPen({'color': self.color_map[self.target_color_list[i]], 'width': 2}), name=name)
-            self.plots[name] = plot
-
-        self.vLine = pg.InfiniteLine(angle=90, movable=False)
-        self.hLine = pg.InfiniteLine(angle=0, movable=False)
-        self.label = pg.TextItem()
+            y_arr = np.asarray(y)
+            if y_arr.dtype.kind != 'f':
+                y_arr = y_arr.astype(np.float64)
+            self.series[name] = (x_arr, y_arr)
+            self.pyramids[name] = MinMaxPyramid()
+            self.pyramids[name].update(y_arr)
+            x_ds, y_ds = self.pyramids[name].decimate(x_arr, y_arr, 0, len(y_arr), n_buckets)
+            pen = pg.mkPen({'color': self.color_map[self.target_color_list[i]], 'width': 2})
+            if name in self.plots:
+                self.plots[name].setData(x_ds, y_ds, connect='finite')
+                self.plots[name].setPen(pen)
+            else:
+                self.plots[name] = self.pw.plot(x_ds, y_ds, connect='finite', pen=pen, name=name)
+
+        # 显示整条折线图；x 范围显式设置，避免自动范围跟随抽稀后的数据
+        if len(x_arr) > 0:
+            self.apply_range(0, len(x_arr) - 1)
+        self.pw.enableAutoRange(axis='y')
+        self.update_decimation()
+        self.update_tooltip_cache()
+
+    def grow(self, key: str, view: np.ndarray, new: np.ndarray) -> np.ndarray:
+        return grow_buffer(self.buffers, key, view, new)
+
+    def append_data(self, xtick_new: np.ndarray, y_new: Dict):
+        # 实时跟踪：新数据追加到各折线末尾，历史数据不重新传给控件；
+        # 视图右边界在数据末尾时随新数据右移，否则只在新数据可见时重绘可见部分
+        if self.whole_x is None or len(xtick_new) == 0:
+            return
+        n_old = len(self.whole_x)
+        x_new = np.arange(n_old, n_old + len(xtick_new), dtype=np.float64)
+        x_min, x_max = self.pw.getViewBox().viewRange()[0]
+        follow = x_max >= self.whole_x[-1]
+        right_at_end = self.right_slider.value() == n_old - 1
+        self.whole_x = self.grow('x', self.whole_x, x_new)
+        self.whole_xtick = self.x_Tick = self.grow('xTick', self.whole_xtick, xtick_new)
+        self.pw.getAxis('bottom').set_labels(self.x_Tick)
+        for name, (_, y) in list(self.series.items()):
+            values = y_new.get(name, np.full(len(x_new), np.nan))
+            self.series[name] = (self.whole_x, self.grow(name, y, values))
+            self.pyramids[name].update(self.series[name][1])
+        self.update_tooltip_cache()
+        last_index = len(self.whole_x) - 1
+        self.left_slider.blockSignals(True)
+        self.right_slider.blockSignals(True)
+        self.left_slider.setMaximum(last_index)
+        self.right_slider.setMaximum(last_index)
+        if right_at_end:
+            self.right_slider.setValue(last_index)
+        self.left_slider.blockSignals(False)
+        self.right_slider.blockSignals(False)
+        self.right_label.setText(f"{self.whole_xtick[self.right_slider.value()]}:右边")
+        if follow:
+            width = x_max - x_min
+            self.pw.setXRange(x_new[-1] - width, x_new[-1], padding=0)
+        elif x_max >= x_new[0]:
+            self.decimate_timer.start()
+
+    def apply_range(self, left: int, right: int):
+        # 只改变视图范围，刻度由坐标轴按可见范围生成，折线由抽稀层按新范围更新
+        self.duration_label.setText(f"{self.x_Tick[left]}~{self.x_Tick[right]}")
+        self.pw.setXRange(float(self.whole_x[left]), float(self.whole_x[right]), padding=0)
+        pass
 
-        self.pw.addItem(self.vLine, ignoreBounds=True)
-        self.pw.addItem(self.hLine, ignoreBounds=True)
-        self.pw.addItem(self.label, ignoreBounds=True)
-        self.vb = self.pw.getViewBox()
-        self.proxy = pg.SignalProxy(self.pw.scene().sigMouseMoved, rateLimit=60, slot=self.mouseMoved)
+    def decimate_buckets(self) -> int:
+        # 每个像素一个桶（最小值+最大值两个点），即约 2 倍像素宽度的点数
+        return max(int(self.pw.getViewBox().width()), 200)
 
-        # 显示整条折线图
-        self.pw.enableAutoRange()
+    def update_decimation(self):
+        if not self.series:
+            return
+        x_min, x_max = self.pw.getViewBox().viewRange()[0]
+        n_buckets = self.decimate_buckets()
+        for name, plot in self.plots.items():
+            x, y = self.series[name]
+            # 左右各多取一个点，折线能画到视图边缘
+            i0 = max(int(np.searchsorted(x, x_min, 'left')) - 1, 0)
+            i1 = min(int(np.searchsorted(x, x_max, 'right')) + 1, len(x))
+            x_ds, y_ds = self.pyramids[name].decimate(x, y, i0, i1, n_buckets)
+            plot.setData(x_ds, y_ds, connect='finite')
+        # 鼠标缩放、平移后范围标签跟随可见范围
+        if self.whole_x is not None and len(self.whole_x) > 0:
+            left = int(np.clip(np.searchsorted(self.whole_x, x_min, 'left'), 0, len(self.whole_x) - 1))
+            right = int(np.clip(np.searchsorted(self.whole_x, x_max, 'right') - 1, 0, len(self.whole_x) - 1))
+            self.duration_label.setText(f"{self.x_Tick[left]}~{self.x_Tick[right]}")
+        # 视图变化后提示框位置需要重新计算
+        self.hover_index = None
+        pass
 
     def set_empty(self):
-        self.pw.clear()
+        for name in list(self.plots):
+            self.remove_plot(name)
+        pass
+
+    def update_tooltip_cache(self):
+        # 每条折线的提示前缀（颜色、名称）只在数据变化时生成一次
+        self.tooltip_prefix = []
+        for i, name in enumerate(self.y_names):
+            if name not in self.plots:
+                continue
+            color = self.color_16bit_map[self.target_color_list[i]]
+            self.tooltip_prefix.append((f"<br><font color='{color}'>{name}: ", self.series[name][1]))
+        self.hover_index = None
         pass
 
+    def nearest_index(self, x_value: float) -> int:
+        # 二分查找最近的真实采样点，x 可以是不等间隔的时间轴
+        x = self.whole_x
+        if x is None or len(x) == 0:
+            return -1
+        if x_value < x[0] or x_value > x[-1]:
+            return -1
+        i = int(np.searchsorted(x, x_value))
+        if i > 0 and (i == len(x) or x_value - x[i - 1] <= x[i] - x_value):
+            i -= 1
+        return i
+
     def mouseMoved(self, evt):
         pos = evt[0]  # 当前鼠标位置
         if self.pw.sceneBoundingRect().contains(pos):
             mousePoint = self.vb.mapSceneToView(pos)
-            index = int(mousePoint.x())
-            if 0 <= index < len(self.x_Tick):
-                x_str = self.x_Tick[index]
-
-                y_str_html = ''
-                for i in range(len(self.target_color_list)):
-                    y_str = f"<br><font color='{self.color_16bit_map[self.target_color_list[i]]}'>{self.y_names[i]}: {self.y_data[i][index]}</font>"
-                    y_str_html += y_str
-
-                html_str = f'<p style="color:black;font-size:18px;font-weight:bold;">&nbsp;{x_str}&nbsp;{y_str_html}</p>'
-                self.label.setHtml(html_str)
-
-                # 调整标签位置
-                label_bounds = self.label.mapRectToView(self.label.boundingRect())
-                new_x = mousePoint.x()
-                new_y = mousePoint.y()
-                if label_bounds.right() > self.vb.viewRect().right():
-                    new_x -= label_bounds.width()
-                if label_bounds.bottom() > self.vb.viewRect().bottom():
-                    new_y -= label_bounds.height()
-
-                self.label.setPos(new_x, new_y)
-
-            self.vLine.setPos(mousePoint.x())
             self.hLine.setPos(mousePoint.y())
+            index = self.nearest_index(mousePoint.x())
+            if index < 0:
+                self.vLine.setPos(mousePoint.x())
+                return
+            self.vLine.setPos(self.whole_x[index])
+            # 悬停的采样点没变时不重新生成提示框
+            if index == self.hover_index:
+                return
+            self.hover_index = index
+            x_str = self.x_Tick[index]
+
+            # str() 按最短十进制表示输出，float32 列显示 5000.12 而不是 5000.1201171875
+            y_str_html = ''.join([f"{prefix}{str(y[index])}</font>" for prefix, y in self.tooltip_prefix])
+
+            html_str = f'<p style="color:black;font-size:18px;font-weight:bold;">&nbsp;{x_str}&nbsp;{y_str_html}</p>'
+            self.label.setHtml(html_str)
+
+            # 调整标签位置
+            label_bounds = self.label.mapRectToView(self.label.boundingRect())
+            new_x = float(self.whole_x[index])
+            new_y = mousePoint.y()
+            if new_x + label_bounds.width() > self.vb.viewRect().right():
+                new_x -= label_bounds.width()
+            if new_y + label_bounds.height() > self.vb.viewRect().bottom():
+                new_y -= label_bounds.height()
+
+            self.label.setPos(new_x, new_y)
 
     def left_slider_valueChanged(self):
         left_value = self.left_slider.value()
         self.left_label.setText(f"左边:{self.whole_xtick[left_value]}")
+        self.live_apply_range()
         pass
 
     def right_slider_valueChanged(self):
         right_value = self.right_slider.value()
         self.right_label.setText(f"{self.whole_xtick[right_value]}:右边")
+        self.live_apply_range()
+
+    def live_apply_range(self):
+        if not self.live_checkbox.isChecked():
+            return
+        left_value = self.left_slider.value()
+        right_value = self.right_slider.value()
+        if right_value > left_value:
+            self.apply_range(left_value, right_value)
+
+    def mark_outliers(self, name: str, mask: np.ndarray, start: int = 0):
+        # 用红色散点标出折线上的异常值；折线不在图中时忽略。
+        # start>0 时 mask 只对应 start 之后的新行，新的异常点追加到已有的点之后
+        if name not in self.series:
+            return
+        x, y = self.series[name]
+        index = start + np.flatnonzero(mask[:len(x) - start])
+        item = self.outlier_items.get(name)
+        if item is None:
+            item = pg.ScatterPlotItem(pen=None, brush=pg.mkBrush(255, 0, 0), size=8)
+            self.pw.addItem(item)
+            self.outlier_items[name] = item
+        if start == 0:
+            item.setData(x[index], y[index])
+        elif len(index):
+            item.addPoints(x=x[index], y=y[index])
 
     def remove_plot(self, plot_name):
         if plot_name in self.plots:
             self.pw.removeItem(self.plots[plot_name])  # 从图表中移除折线
             del self.plots[plot_name]  # 从字典中移除折线引用
+            del self.series[plot_name]
+            del self.pyramids[plot_name]
+            if plot_name in self.outlier_items:
+                self.pw.removeItem(self.outlier_items.pop(plot_name))
+            self.update_tooltip_cache()
 
     def check_btn_clicked(self):
         left_value = self.left_slider.value()
@@ -231,29 +2231,7 @@ class GraphWidget(QtWidgets.QWidget):
                 QtWidgets.QMessageBox.Yes
             )
             return
-        xTick = self.whole_data['xTick'][left_value:right_value]
-        xTick00 = []
-        dur_num = int(len(xTick) / float(self.cur_len))
-        if dur_num >= 2:
-            for i in range(0, len(xTick), dur_num):
-                xTick00.append((i, xTick[i]))
-        else:
-            for i in range(0, len(xTick)):
-                xTick00.append((i, xTick[i]))
-        y_list00 = []
-        y_list = self.whole_data['y_list']
-        for item in y_list:
-            item00 = item[left_value:right_value]
-            y_list00.append(item00)
-        x = [i for i in range(len(xTick))]
-        line_data = {
-            'xTick00': xTick00,
-            'xTick': xTick,
-            'x': x,
-            'y_list': y_list00,
-            'y_names': self.whole_data['y_names']
-        }
-        self.set_data(line_data)
+        self.apply_range(left_value, right_value)
         pass
 
     pass
@@ -271,8 +2249,17 @@ class LineMainWidget(QtWidgets.QWidget):
         self.field_list: list = []
         self.x_field: str = ''
         self.current_filename: str = ''
-        self.whole_df: pd.DataFrame = None
+        self.dataset: SessionDataset = SessionDataset()
         self.cur_len: int = 20
+        self.thread_pool = QtCore.QThreadPool.globalInstance()
+        self.job: OperationJob = None
+        self.tailer: CsvTailer = None
+        self.result_cache: ResultCache = ResultCache()
+        self.diagnostics_dialog = None
+        # 叠加对比的附加文件：显示名 -> OverlayFile，对应的折线名为 显示名:列名
+        self.overlays: Dict[str, OverlayFile] = {}
+        # 处理链中尚未执行的步骤
+        self.pipeline_steps: list = []
         pass
 
     def init_ui(self):
@@ -285,6 +2272,12 @@ class LineMainWidget(QtWidgets.QWidget):
         self.file_name_label.setWordWrap(True)
         open_file_btn = QtWidgets.QPushButton('打开excel文件')
         open_file_btn.clicked.connect(self.open_file_btn_clicked)
+        # 勾选后每秒检查 CSV 文件末尾新写入的数据并追加到图中
+        self.follow_checkbox = QtWidgets.QCheckBox('实时跟踪文件')
+        self.follow_checkbox.toggled.connect(self.follow_checkbox_toggled)
+        self.follow_timer = QtCore.QTimer(self)
+        self.follow_timer.setInterval(1000)
+        self.follow_timer.timeout.connect(self.follow_tick)
 
         tip_label = QtWidgets.QLabel('表头下拉列表:')
         self.head_combox = QtWidgets.QComboBox()
@@ -306,15 +2299,27 @@ class LineMainWidget(QtWidgets.QWidget):
         clear_btn = QtWidgets.QPushButton('清空')
         clear_btn.clicked.connect(self.clear_btn_clicked)
 
-        #tackle_label = QtWidgets.QLabel('要处理的文件横坐标字段:')
-        #self.textEdit = QtWidgets.QTextEdit()
-        #self.textEdit.setFixedHeight(40)
-        #self.x_lineedit1 = QtWidgets.QLineEdit()
-
-        #self.file_name_label1 = QtWidgets.QLabel('文件名')
-        #self.file_name_label1.setWordWrap(True)
-        #open_file_btn1 = QtWidgets.QPushButton('打开excel文件')
-        #open_file_btn1.clicked.connect(self.open_file_btn_clicked1)
+        # 对比文件：可以打开多个，按主文件的时间对齐后叠加显示
+        overlay_btn = QtWidgets.QPushButton('添加对比文件')
+        overlay_btn.clicked.connect(self.overlay_btn_clicked)
+        overlay_clear_btn = QtWidgets.QPushButton('移除对比文件')
+        overlay_clear_btn.clicked.connect(self.overlay_clear_btn_clicked)
+        self.overlay_label = QtWidgets.QLabel('对比文件')
+        self.overlay_label.setWordWrap(True)
+        self.overlay_combox = QtWidgets.QComboBox()
+        self.overlay_combox.addItem(self.please_selected_str)
+        self.overlay_combox.currentTextChanged.connect(self.overlay_combox_currentTextChanged)
+        # 对齐容差，0 表示按各对比文件采样间隔的 2 倍
+        self.overlay_tolerance_spin = QtWidgets.QSpinBox()
+        self.overlay_tolerance_spin.setRange(0, 86400)
+        self.overlay_tolerance_spin.setSpecialValueText('自动')
+        self.overlay_tolerance_spin.setSuffix('秒')
+        layout_overlay = QtWidgets.QHBoxLayout()
+        layout_overlay.addWidget(overlay_btn)
+        layout_overlay.addWidget(overlay_clear_btn)
+        layout_tolerance = QtWidgets.QHBoxLayout()
+        layout_tolerance.addWidget(QtWidgets.QLabel('对齐容差'))
+        layout_tolerance.addWidget(self.overlay_tolerance_spin)
 
         tip_label2 = QtWidgets.QLabel('选择要处理的表头:')
         self.body_combox = QtWidgets.QComboBox()
@@ -338,21 +2343,88 @@ class LineMainWidget(QtWidgets.QWidget):
         losses_btn.clicked.connect(self.tab2)
         anomaly_btn = QtWidgets.QPushButton('异常值处理')
         anomaly_btn.clicked.connect(self.handle_anomaly_lof)
+        # LOF 参数：近邻数、异常比例（auto 或 0~0.5 的小数）、按时间分段长度（0 表示整列）
+        self.lof_neighbors_spin = QtWidgets.QSpinBox()
+        self.lof_neighbors_spin.setRange(2, 1000)
+        self.lof_neighbors_spin.setValue(20)
+        self.lof_contamination_combox = QtWidgets.QComboBox()
+        self.lof_contamination_combox.setEditable(True)
+        self.lof_contamination_combox.addItems(['auto', '0.01', '0.05', '0.1'])
+        self.lof_window_spin = QtWidgets.QSpinBox()
+        self.lof_window_spin.setRange(0, 100000000)
+        self.lof_window_spin.setSingleStep(1000)
+        self.lof_window_spin.setSpecialValueText('整列')
+        layout_lof = QtWidgets.QHBoxLayout()
+        layout_lof.addWidget(QtWidgets.QLabel('近邻数'))
+        layout_lof.addWidget(self.lof_neighbors_spin)
+        layout_lof.addWidget(QtWidgets.QLabel('比例'))
+        layout_lof.addWidget(self.lof_contamination_combox)
+        layout_lof.addWidget(QtWidgets.QLabel('分段'))
+        layout_lof.addWidget(self.lof_window_spin)
+        online_btn = QtWidgets.QPushButton('在线异常值检测')
+        online_btn.clicked.connect(self.handle_anomaly_online)
+        # 在线检测参数：滑动窗口长度、阈值（标准差倍数）
+        self.online_window_spin = QtWidgets.QSpinBox()
+        self.online_window_spin.setRange(3, 100000)
+        self.online_window_spin.setValue(60)
+        self.online_threshold_spin = QtWidgets.QDoubleSpinBox()
+        self.online_threshold_spin.setRange(0.5, 20)
+        self.online_threshold_spin.setSingleStep(0.5)
+        self.online_threshold_spin.setValue(3.0)
+        layout_online = QtWidgets.QHBoxLayout()
+        layout_online.addWidget(QtWidgets.QLabel('窗口'))
+        layout_online.addWidget(self.online_window_spin)
+        layout_online.addWidget(QtWidgets.QLabel('阈值'))
+        layout_online.addWidget(self.online_threshold_spin)
         move_btn = QtWidgets.QPushButton('移动平均滤波')
         move_btn.clicked.connect(self.tab4_1)
+        self.window_spin = QtWidgets.QSpinBox()
+        self.window_spin.setRange(2, 100000)
+        self.window_spin.setValue(3)
         mean_btn = QtWidgets.QPushButton('均值滤波')
         mean_btn.clicked.connect(self.tab4_2)
+        self.alpha_spin = QtWidgets.QDoubleSpinBox()
+        self.alpha_spin.setRange(0.01, 1)
+        self.alpha_spin.setSingleStep(0.05)
+        self.alpha_spin.setValue(0.2)
+        layout_move = QtWidgets.QHBoxLayout()
+        layout_move.addWidget(QtWidgets.QLabel('窗口'))
+        layout_move.addWidget(self.window_spin)
+        layout_move.addWidget(move_btn)
+        layout_mean = QtWidgets.QHBoxLayout()
+        layout_mean.addWidget(QtWidgets.QLabel('平滑系数'))
+        layout_mean.addWidget(self.alpha_spin)
+        layout_mean.addWidget(mean_btn)
+
+        # 处理链：按顺序执行多个处理，每一步的结果按处理链缓存，只改后面步骤的参数时前面的步骤不重算
+        self.pipeline_lineedit = QtWidgets.QLineEdit('impute:window=4,lof,moving_average:window=3,zscore')
+        pipeline_btn = QtWidgets.QPushButton('执行处理链')
+        pipeline_btn.clicked.connect(self.pipeline_btn_clicked)
 
         getwighte_btn = QtWidgets.QPushButton('变化值')
         getwighte_btn.clicked.connect(self.tab5_1)
         rate_btn = QtWidgets.QPushButton('蒸腾速率')
         rate_btn.clicked.connect(self.tab5_2)
+        self.rate_interval_combox = QtWidgets.QComboBox()
+        self.rate_interval_combox.addItems(list(RATE_INTERVALS))
+        self.rate_interval_combox.setCurrentText('1小时')
+        gsc_btn = QtWidgets.QPushButton('气孔导度')
+        gsc_btn.clicked.connect(self.tab5_3)
+        self.gsc_pairs_edit = QtWidgets.QPlainTextEdit()
+        self.gsc_pairs_edit.setPlaceholderText('每行一个时间段，如\n2022-09-14 20 2022-09-14 21\n留空则计算相邻时间段')
+        self.gsc_pairs_edit.setFixedHeight(60)
+
+        save_btn = QtWidgets.QPushButton('保存处理结果')
+        save_btn.clicked.connect(self.save_btn_clicked)
+        export_btn = QtWidgets.QPushButton('导出Excel')
+        export_btn.clicked.connect(self.export_btn_clicked)
 
         layout_left = QtWidgets.QVBoxLayout()
         layout_left.addWidget(tip_label1)
         layout_left.addWidget(self.x_lineedit)
         layout_left.addWidget(self.file_name_label)
         layout_left.addWidget(open_file_btn)
+        layout_left.addWidget(self.follow_checkbox)
         layout_left.addWidget(tip_label)
         layout_left.addWidget(self.head_combox)
         layout_left.addWidget(self.list_widget)
@@ -364,10 +2436,10 @@ class LineMainWidget(QtWidgets.QWidget):
         #layout_left.addWidget(delete_btn0)
         layout_left.addWidget(clear_btn)
 
-        #layout_left.addWidget(tackle_label)
-        #layout_left.addWidget(self.x_lineedit1)
-        #layout_left.addWidget(self.file_name_label1)
-        #layout_left.addWidget(open_file_btn1)
+        layout_left.addLayout(layout_overlay)
+        layout_left.addWidget(self.overlay_label)
+        layout_left.addWidget(self.overlay_combox)
+        layout_left.addLayout(layout_tolerance)
         layout_left.addWidget(tip_label2)
         layout_left.addWidget(self.body_combox)
         layout_left.addWidget(self.list_widget2)
@@ -378,15 +2450,25 @@ class LineMainWidget(QtWidgets.QWidget):
 
 
         layout_left.addWidget(losses_btn)
+        layout_left.addLayout(layout_lof)
         layout_left.addWidget(anomaly_btn)
-        layout_left.addWidget(move_btn)
-        layout_left.addWidget(mean_btn)
+        layout_left.addLayout(layout_online)
+        layout_left.addWidget(online_btn)
+        layout_left.addLayout(layout_move)
+        layout_left.addLayout(layout_mean)
 
         layout_left.addWidget(normal0_btn)
         layout_left.addWidget(normal_btn)
        #layout_left.addWidget(self.textEdit)
         layout_left.addWidget(getwighte_btn)
+        layout_left.addWidget(self.rate_interval_combox)
         layout_left.addWidget(rate_btn)
+        layout_left.addWidget(self.gsc_pairs_edit)
+        layout_left.addWidget(gsc_btn)
+        layout_left.addWidget(self.pipeline_lineedit)
+        layout_left.addWidget(pipeline_btn)
+        layout_left.addWidget(save_btn)
+        layout_left.addWidget(export_btn)
 
         layout_left.addStretch(1)
 
@@ -396,9 +2478,34 @@ class LineMainWidget(QtWidgets.QWidget):
 
         self.line_widget = GraphWidget()
 
+        # 后台处理进度
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.cancel_btn = QtWidgets.QPushButton('取消')
+        self.cancel_btn.clicked.connect(self.cancel_btn_clicked)
+        layout_progress = QtWidgets.QHBoxLayout()
+        layout_progress.addWidget(self.progress_bar)
+        layout_progress.addWidget(self.cancel_btn)
+        self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
+
+        # 状态栏显示最近一个阶段的耗时，诊断面板显示全部记录
+        self.status_label = QtWidgets.QLabel()
+        diagnostics_btn = QtWidgets.QPushButton('诊断')
+        diagnostics_btn.clicked.connect(self.diagnostics_btn_clicked)
+        layout_status = QtWidgets.QHBoxLayout()
+        layout_status.addWidget(self.status_label, 1)
+        layout_status.addWidget(diagnostics_btn)
+        self.stage_signals = StageSignals()
+        self.stage_signals.recorded.connect(self.stage_recorded)
+        # 每次取 recorded.emit 都是新的绑定对象，保存下来以便关闭时移除
+        self._stage_listener = self.stage_signals.recorded.emit
+        STAGES.listeners.append(self._stage_listener)
+
         layout_right = QtWidgets.QVBoxLayout()
         layout_right.addWidget(self.title_label)
+        layout_right.addLayout(layout_progress)
         layout_right.addWidget(self.line_widget)
+        layout_right.addLayout(layout_status)
 
         layout = QtWidgets.QHBoxLayout()
         layout.addLayout(layout_left, 1)
@@ -438,12 +2545,12 @@ class LineMainWidget(QtWidgets.QWidget):
         )
         if not path:
             return
-        if path.endswith('.xlsx'):
-            df = pd.read_excel(path, engine='openpyxl')
-            pass
-        elif path.endswith('.csv'):
-            df = pd.read_csv(path, encoding='GB2312')
-
+        if path.endswith('.xlsx') or path.endswith('.csv'):
+            self.dataset.keep_columns = (x_str,) + TIME_COLUMNS
+            with STAGES.stage('load', file=os.path.basename(path)) as record:
+                key = self.dataset.file_key(path)
+                df = self.dataset.read(path, key)
+                record['rows'] = len(df)
             pass
         else:
             QtWidgets.QMessageBox.information(
@@ -464,13 +2571,80 @@ class LineMainWidget(QtWidgets.QWidget):
                 QtWidgets.QMessageBox.Yes
             )
             return
-        for col in cols:
-            if str(df[col].dtype) == 'object':
-                continue
-            self.field_list.append(col)
+        # 切换文件前先停止跟踪，并把上一个文件未保存的派生列写出
+        self.follow_checkbox.setChecked(False)
+        self.dataset.flush()
         self.x_field = x_str
         self.current_filename = os.path.basename(path)
-        self.whole_df = df.copy()
+        self.dataset.load(path, df, key)
+        self.update_field_combox()
+        if self.dataset.stale_sidecar:
+            QtWidgets.QMessageBox.information(
+                self, '提示', f'源文件在保存处理结果后被修改过，{self.dataset.stale_sidecar} 中的结果已不再对应，未载入',
+                QtWidgets.QMessageBox.Yes)
+        pass
+
+    def follow_checkbox_toggled(self, checked: bool):
+        if not checked:
+            self.follow_timer.stop()
+            self.tailer = None
+            self.dataset.following = False
+            return
+        if not self.dataset.path.endswith('.csv'):
+            QtWidgets.QMessageBox.information(
+                self, '提示', '只能跟踪 CSV 文件', QtWidgets.QMessageBox.Yes)
+            self.follow_checkbox.setChecked(False)
+            return
+        # 从当前已加载的内容之后开始跟踪
+        if self.dataset.is_stale():
+            self.dataset.reload()
+        self.tailer = CsvTailer(self.dataset.path, self.dataset.columns)
+        self.dataset.following = True
+        self.follow_timer.start()
+
+    def follow_tick(self):
+        # 后台处理进行中时暂停追加，新数据留在文件里，处理完成后的下一次再读取，
+        # 处理结果的行数与数据保持一致
+        if self.job is not None:
+            return
+        new_df = self.tailer.read_new()
+        if new_df is None:
+            # 文件被截断或替换：整体重新加载后从新的末尾继续跟踪
+            self.dataset.following = False
+            self.dataset.reload()
+            self.tailer = CsvTailer(self.dataset.path, self.dataset.columns)
+            self.dataset.following = True
+            self.update_field_combox()
+            if self.line_widget.whole_x is not None:
+                self.check_btn_clicked()
+            return
+        if new_df.empty:
+            return
+        with STAGES.stage('load', rows=len(new_df), file=os.path.basename(self.dataset.path), follow=True):
+            n_old = self.dataset.append_rows(new_df)
+        graph = self.line_widget
+        if graph.whole_x is None:
+            return
+        _, xTick = self.dataset.time_index(self.x_field)
+        y_new = {name: self.plot_values(name, n_old) for name in graph.series}
+        with STAGES.stage('render', rows=len(new_df), follow=True):
+            graph.append_data(xTick[n_old:], y_new)
+        # 在线异常值检测的新结果直接标在图上，只传新行的异常标记
+        for name, (col, op, _, _) in self.dataset.sources.items():
+            if op == 'online' and col in graph.series:
+                mask = np.isfinite(self.dataset.column(col, n_old)) & np.isnan(self.dataset.column(name, n_old))
+                graph.mark_outliers(col, mask, n_old)
+
+    def update_field_combox(self):
+        # 字段列表包含源数据列和已有的派生列
+        df = self.dataset.frame()
+        self.field_list.clear()
+        for col in df.columns:
+            # 只列出可以绘图的数值列和日期时间列，文本列跳过
+            dtype = df[col].dtype
+            if not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)):
+                continue
+            self.field_list.append(col)
 
         self.head_combox.clear()
         self.head_combox.addItem(self.please_selected_str)
@@ -480,63 +2654,69 @@ class LineMainWidget(QtWidgets.QWidget):
         self.body_combox.addItem(self.please_selected_str)
         self.body_combox.addItems(self.field_list)
         pass
-    def open_file_btn_clicked1(self):
-        x_str = self.x_lineedit1.text()
-        x_str = x_str.strip()
-        if len(x_str) <= 0:
+    def overlay_btn_clicked(self):
+        if self.dataset.df is None:
             QtWidgets.QMessageBox.information(
-                self,
-                '提示',
-                '请先输入横坐标字段名',
-                QtWidgets.QMessageBox.Yes
-            )
+                self, '提示', '请先打开主文件', QtWidgets.QMessageBox.Yes)
             return
-        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+        paths, _ = QtWidgets.QFileDialog.getOpenFileNames(
             self,
-            '打开Excel文件或csv文件',
+            '打开对比文件',
             '.',
             'Excel或CSV(*.xlsx *.csv)'
         )
-        if not path:
-            return
-        if path.endswith('.xlsx'):
-            df = pd.read_excel(path, engine='openpyxl')
-            pass
-        elif path.endswith('.csv'):
-            df = pd.read_csv(path, encoding='GB2312')
+        for path in paths:
+            name = os.path.basename(path)
+            if name in self.overlays and self.overlays[name].path != path:
+                name = f'{name}({len(self.overlays)})'
+            try:
+                with STAGES.stage('load', file=os.path.basename(path), overlay=True) as record:
+                    self.overlays[name] = OverlayFile(path, self.x_field)
+                    record['rows'] = len(self.overlays[name].sorted_ts)
+            except ValueError as e:
+                QtWidgets.QMessageBox.information(self, '提示', str(e), QtWidgets.QMessageBox.Yes)
+        self.update_overlay_combox()
+
+    def overlay_clear_btn_clicked(self):
+        for name in list(self.line_widget.plots):
+            if self.overlay_of(name) is not None:
+                self.line_widget.remove_plot(name)
+        self.overlays = {}
+        self.update_overlay_combox()
+        self.update_plot_remove_combobox()
+
+    def update_overlay_combox(self):
+        self.overlay_label.setText('\n'.join(self.overlays) or '对比文件')
+        self.overlay_combox.blockSignals(True)
+        self.overlay_combox.clear()
+        self.overlay_combox.addItem(self.please_selected_str)
+        for name, overlay in self.overlays.items():
+            self.overlay_combox.addItems([f'{name}:{col}' for col in overlay.value_columns])
+        self.overlay_combox.blockSignals(False)
+
+    def overlay_combox_currentTextChanged(self, txt):
+        # 选中的对比文件列加入要绘制的表头列表
+        if txt and txt != self.please_selected_str:
+            self.list_widget.addItem(txt)
+
+    def overlay_of(self, name: str) -> tuple:
+        # 对比文件的折线名拆成 (OverlayFile, 列名)，主文件的列返回 None
+        for key, overlay in self.overlays.items():
+            if name.startswith(key + ':') and name[len(key) + 1:] in overlay.columns:
+                return overlay, name[len(key) + 1:]
+        return None
+
+    def plot_values(self, name: str, start: int = 0) -> np.ndarray:
+        # 主文件的列直接取数据（float32 保持不变）；对比文件的列只读这一列，按主文件的时间 as-of 对齐
+        found = self.overlay_of(name)
+        if found is not None:
+            overlay, col = found
+            seconds = self.overlay_tolerance_spin.value()
+            tolerance = np.timedelta64(seconds, 's') if seconds else None
+            return overlay.aligned(col, self.dataset.timestamps(self.x_field)[start:], tolerance)
+        values = self.dataset.values(name, start)
+        return values if values.dtype.kind == 'f' else values.astype(np.float64)
 
-            pass
-        else:
-            QtWidgets.QMessageBox.information(
-                self,
-                '提示',
-                '只能上传Excel文件或CSV文件',
-                QtWidgets.QMessageBox.Yes
-            )
-            return
-        self.file_name_label1.setText(path)
-        self.field_list.clear()
-        cols = df.columns
-        if x_str not in cols:
-            QtWidgets.QMessageBox.information(
-                self,
-                '提示',
-                '横坐标字段不在文件中',
-                QtWidgets.QMessageBox.Yes
-            )
-            return
-        for col in cols:
-            if str(df[col].dtype) == 'object':
-                continue
-            self.field_list.append(col)
-        self.x_field = x_str
-        self.current_filename = os.path.basename(path)
-        self.whole_df = df.copy()
-
-        self.body_combox.clear()
-        self.body_combox.addItem(self.please_selected_str)
-        self.body_combox.addItems(self.field_list)
-        pass
     def head_combox_currentTextChanged(self, txt):
         cur_txt = self.head_combox.currentText()
         if len(cur_txt.strip()) <= 0:
@@ -556,17 +2736,11 @@ class LineMainWidget(QtWidgets.QWidget):
         pass
 
     def delete_selected_header(self):
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        df = pd.read_excel(path_rawdata)
-        column_name=self.list_widget2.item(0).text()
-        if column_name in df.columns:
-            # 从 DataFrame 中删除该列
-            df.drop(columns=[column_name], inplace=True)
-
-            # 将修改后的 DataFrame 保存回原 Excel 文件
-            df.to_excel(path_rawdata, index=False)
-        else:
-            print(f"列 '{column_name}' 不存在于文件中。")
+        # 只从会话中删除选中的列，源文件保持不变
+        for column_name in self.selected_columns():
+            if not self.dataset.drop_column(column_name):
+                print(f"列 '{column_name}' 不存在于文件中。")
+        self.update_field_combox()
     def check_btn_clicked(self):
         # 确保已经选择了一些列名
         total_count = self.list_widget.count()
@@ -580,362 +2754,399 @@ class LineMainWidget(QtWidgets.QWidget):
             item = self.list_widget.item(i)
             selected_list.append(item.text())
 
-        df = self.whole_df.copy()
-
-        xTick_tmp = df[self.x_field].values.tolist()
-        xTick = []
-        for item in xTick_tmp:
-            if isinstance(item, int):
-                # 假设 item 是以纳秒为单位的 Unix 时间戳
-                # 将纳秒转换为秒
-                timestamp_in_seconds = item / 1e9
-                date = datetime.fromtimestamp(timestamp_in_seconds).strftime('%Y-%m-%d')
-            elif isinstance(item, str):
-                # 检查字符串格式并解析
-                if '-' in item:
-                    date_format = '%Y-%m-%d'
-                elif '/' in item:
-                    date_format = '%Y/%m/%d'
-                else:
-                    raise ValueError("Unknown date format")
-
-                date = datetime.strptime(item, date_format).strftime('%Y-%m-%d')
-            else:
-                raise TypeError("Unsupported type in xTick_tmp")
-
-            xTick.append(date)
+        # 横坐标解析结果按文件和字段缓存，重新绘图不再逐个解析
+        _, xTick = self.dataset.time_index(self.x_field)
         #print('xTick', xTick)
-        xTick00 = []
-        dur_num = int(len(xTick) / float(self.cur_len))
-        if dur_num >= 2:
-            for i in range(0, len(xTick), dur_num):
-                xTick00.append((i, xTick[i]))
-        else:
-            for i in range(0, len(xTick)):
-                xTick00.append((i, xTick[i]))
+        # 刻度由 GraphWidget 按当前显示范围生成
 
-        y_list = []
+        # 各条折线以连续的浮点数组传给 GraphWidget，不转成 Python 列表，也不复制整个表；
+        # 对比文件的列按主文件的时间对齐后叠加
+        overlay_columns = {}
         for item in selected_list:
-            y_one = df[item].values.tolist()
-            y_list.append(y_one)
+            found = None if self.dataset.has_column(item) else self.overlay_of(item)
+            if not self.dataset.has_column(item) and found is None:
+                QtWidgets.QMessageBox.information(
+                    self, '提示', f'{item} 不在已打开的文件中', QtWidgets.QMessageBox.Yes)
+                return
+            if found is not None:
+                overlay_columns.setdefault(found[0], []).append(found[1])
+        # 同一个对比文件要用到的列一次读出
+        for overlay, names in overlay_columns.items():
+            overlay.load(names)
+        y_list = [np.ascontiguousarray(self.plot_values(item)) for item in selected_list]
 
         if total_count <= 1:
             title_str = f"{self.current_filename}_{selected_list[0]}"
         else:
             title_str = f"{self.current_filename}_多列"
         line_data = {
-            'xTick00': xTick00,
             'xTick': xTick,
-            'x': list(range(len(xTick))),
+            'x': np.arange(len(xTick), dtype=np.float64),
             'y_list': y_list,
             'y_names': selected_list
         }
         self.title_label.setText("数据分析平台")
-        self.line_widget.first_setData(line_data)
-
+        with STAGES.stage('render', rows=len(xTick), columns=len(y_list)):
+            self.line_widget.first_setData(line_data)  # 绘制图表
+        self.update_plot_remove_combobox()  # 更新下拉列表以反映当前图表中的折线名称
 
+    def save_btn_clicked(self):
+        with STAGES.stage('write-back', rows=self.dataset.n_rows,
+                          columns=len(self.dataset.derived)):
+            sidecar = self.dataset.flush()
+        if sidecar:
+            QtWidgets.QMessageBox.information(
+                self, '提示', f'处理结果已保存到 {sidecar}', QtWidgets.QMessageBox.Yes)
 
-        self.line_widget.first_setData(line_data)  # 绘制图表
-        self.update_plot_remove_combobox()  # 更新下拉列表以反映当前图表中的折线名称
+    def export_btn_clicked(self):
+        if self.dataset.df is None:
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            '导出Excel文件',
+            os.path.splitext(self.dataset.path)[0] + '_处理结果.xlsx',
+            'Excel(*.xlsx)'
+        )
+        if not path:
+            return
+        self.dataset.export_excel(path)
+
+    def stage_recorded(self, record: dict):
+        self.status_label.setText(StageRecorder.describe(record))
+        if self.diagnostics_dialog is not None and self.diagnostics_dialog.isVisible():
+            self.diagnostics_dialog.refresh()
+
+    def diagnostics_btn_clicked(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.refresh()
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
+    def closeEvent(self, event):
+        # 退出时停止跟踪、取消后台处理并写出未保存的派生列
+        self.follow_timer.stop()
+        if self.job is not None:
+            self.job.cancel()
+            self.thread_pool.waitForDone()
+        self.dataset.flush()
+        if self._stage_listener in STAGES.listeners:
+            STAGES.listeners.remove(self._stage_listener)
+        super().closeEvent(event)
 
     def clear_btn_clicked(self):
         self.list_widget.clear()
     def clear_btn_clicked1(self):
         self.list_widget2.clear()
 
-    def ZSCORE(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        content00 = self.list_widget2.item(0).text()
-        content00 = str(content00)
-        data1 = pd.read_excel(path_rawdata)
-
-        # 计算 z-score 标准化，并添加 content00 值作为列名的前缀
-        new_column_name = content00 + '_z-score标准化'
-        data1[new_column_name] = (data1[content00] - data1[content00].mean()) / data1[content00].std()
-
-        # 将更改保存回原始文件
-        data1.to_excel(path_rawdata, index=False)
-
-        # 绘图部分
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-        plt.plot(x_ticks, data1[new_column_name].tolist(), marker='o', label='z-score标准化')
-        plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.grid(True)
-        plt.show()
+    def selected_columns(self) -> list:
+        return [self.list_widget2.item(i).text() for i in range(self.list_widget2.count())]
 
-    def tab1(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        content00 = self.list_widget2.item(0).text()
-        content00 = str(content00)
-        data1 = pd.read_excel(path_rawdata)
-
-        # 计算标准化数据
-        normalized_column_name = content00 + '_最大最小标准化'  # 新列名，加上content00的值作为前缀
-        data1[normalized_column_name] = (data1[content00] - data1[content00].min()) / (
-                data1[content00].max() - data1[content00].min())
-
-        # 将更改保存回原始文件
-        data1.to_excel(path_rawdata, index=False)
-
-        # 绘图部分
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-        plt.plot(x_ticks, data1[normalized_column_name].tolist(), marker='o', label='最大最小标准化')
-        plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.grid(True)
+    def run_operation(self, op: str, params: dict = None, columns: list = None, **plot_kwargs):
+        # 对“选择要处理的表头”里的所有列执行同一个处理；计算在后台线程进行，
+        # 完成后在界面线程写入派生列并绘图。已经算过的（同一处理链、同样参数）直接取缓存
+        if self.job is not None:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '上一个处理还没有完成', QtWidgets.QMessageBox.Yes)
+            return
+        columns = columns or self.selected_columns()
+        if not columns:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '请先选择要处理的表头', QtWidgets.QMessageBox.Yes)
+            return
+        suffix, func = OPERATIONS[op]
+        names = [col + suffix for col in columns]
+        # 记录派生列的来源，实时跟踪文件时据此增量计算；时间戳等按行的参数不记录
+        stored = {k: v for k, v in (params or {}).items() if k not in ('timestamp', 'keys')}
+        sources = [(col, op, stored, self.x_field) for col in columns]
+        keys = [self.dataset.result_key(col, op, stored, self.x_field) for col in columns]
+        cached = [self.result_cache.get(key) for key in keys]
+        missing = [k for k, hit in enumerate(cached) if hit is None]
+
+        def finished(result):
+            full = np.empty((self.dataset.n_rows, len(columns)))
+            for k, hit in enumerate(cached):
+                if hit is not None:
+                    full[:, k] = hit
+            for j, k in enumerate(missing):
+                full[:, k] = result[:, j]
+                self.result_cache.put(keys[k], result[:, j].copy())
+            self.job_finished(columns, names, sources, full, plot_kwargs)
+
+        if not missing:
+            finished(None)
+            return
+        values = np.column_stack([self.dataset.column(columns[k]) for k in missing])
+        self.start_job(func, values, params or {}, finished)
+
+    def start_job(self, func, values: np.ndarray, params: dict, finished):
+        # 在线程池中计算，完成后在界面线程调用 finished(result)；进度、取消、出错统一处理。
+        # 计算期间数据变了（重新打开、重新加载了文件）时结果的行数与当前数据不再对应，直接丢弃
+        version = self.dataset.version
+
+        def checked(result):
+            if self.dataset.version != version:
+                self.job_cancelled()
+                QtWidgets.QMessageBox.information(
+                    self, '提示', '处理期间数据已重新加载，本次结果已丢弃，请重新处理', QtWidgets.QMessageBox.Yes)
+                return
+            finished(result)
+
+        self.job = OperationJob(func, values, params)
+        self.job.signals.progress.connect(self.job_progress)
+        self.job.signals.finished.connect(checked)
+        self.job.signals.cancelled.connect(self.job_cancelled)
+        self.job.signals.error.connect(self.job_error)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.cancel_btn.setVisible(True)
+        self.thread_pool.start(self.job)
+
+    def job_progress(self, done: int, total: int):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+
+    def job_done(self):
+        self.job = None
+        self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
+
+    def job_finished(self, columns: list, names: list, sources: list, result: np.ndarray, plot_kwargs: dict):
+        self.job_done()
+        with STAGES.stage('write-back', rows=len(result), columns=len(names)):
+            for k, name in enumerate(names):
+                self.dataset.add_derived(name, result[:, k], sources[k])
+            self.update_field_combox()
+        if self.pipeline_steps:
+            # 处理链的下一步以这一步的结果为输入
+            self.run_pipeline_step(names)
+            return
+        self.plot_results(columns, names, result, **plot_kwargs)
+
+    def job_cancelled(self):
+        self.pipeline_steps = []
+        self.job_done()
+
+    def job_error(self, message: str):
+        self.pipeline_steps = []
+        self.job_done()
+        QtWidgets.QMessageBox.warning(self, '错误', f'处理失败：{message}')
+
+    def cancel_btn_clicked(self):
+        if self.job is not None:
+            self.job.cancel()
+
+    def plot_results(self, columns: list, names: list, result: np.ndarray, compare: bool = False,
+                     sparse: bool = False, highlight: bool = False, title: str = None, ylabel: str = None):
+        # 绘图部分；横坐标用缓存的时间索引，不再给每一行生成刻度标签
+        with STAGES.stage('render', rows=len(result), columns=len(names), figure=title or ''):
+            self.plot_figure(columns, names, result, compare, sparse, highlight, title, ylabel)
+        plt = get_pyplot()
         plt.show()
 
-    def tab2(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        content00 = self.list_widget2.item(0).text()  # 获取选中的列名
-        data1 = pd.read_excel(path_rawdata)
-
-        # 创建新列名，以表示这是处理后的数据
-        new_column_name = content00 + '_缺失值处理'
-
-        # 复制原始列的数据到新列
-        data1[new_column_name] = data1[content00].copy()
-
-        # 替换新列中的0为NaN，并处理缺失值
-        data1[new_column_name].replace(0, np.nan, inplace=True)
-        for i in range(len(data1)):
-            if pd.isnull(data1.loc[i, new_column_name]):
-                # 获取前后4个非NaN和非0的值
-                valid_indices = [j for j in range(max(0, i - 4), min(len(data1), i + 5)) if
-                                 j != i and not pd.isnull(data1.loc[j, new_column_name]) and data1.loc[j, new_column_name] != 0]
-                if valid_indices:
-                    mean_val = data1.loc[valid_indices, new_column_name].mean()
-                else:
-                    mean_val = data1[new_column_name].mean()
-                data1.loc[i, new_column_name] = mean_val
-
-        # 将DataFrame保存回原始文件，这样原始数据列保持不变，只是新增了处理后的列
-        data1.to_excel(path_rawdata, index=False)
-
-        # 绘图部分
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
+    def plot_figure(self, columns: list, names: list, result: np.ndarray, compare: bool, sparse: bool,
+                    highlight: bool, title: str, ylabel: str):
+        ts = self.dataset.timestamps(self.x_field)
+        df = self.dataset.frame()
+        if highlight:
+            # 原值有效、处理后为NaN的点即异常值，在主界面已绘制的折线上标出
+            for k, col in enumerate(columns):
+                original = df[col].to_numpy(dtype=np.float64)
+                self.line_widget.mark_outliers(col, np.isfinite(original) & np.isnan(result[:, k]))
+        plt = get_pyplot()
         plt.figure(figsize=(10, 6))  # 设置图形大小
-        plt.plot(x_ticks, data1[content00].tolist(), marker='o', linestyle='-', label='原始数据')
-        plt.plot(x_ticks, data1[new_column_name].tolist(), marker='x', linestyle='--', label='缺失值处理后')
+        for k, (col, name) in enumerate(zip(columns, names)):
+            y = result[:, k]
+            if compare:
+                plt.plot(ts, df[col].to_numpy(), marker='o', linestyle='-', label=f'{col}原始数据')
+                plt.plot(ts, y, marker='x', linestyle='--', label=name)
+            elif sparse:
+                # 只有每组首条记录有值，去掉NaN后连成折线
+                mask = np.isfinite(y)
+                plt.plot(ts[mask], y[mask], marker='o', label=name)
+            else:
+                plt.plot(ts, y, marker='o', label=name)
         plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.ylabel('值')
-        plt.title('缺失值处理前后对比')
+        plt.xticks(rotation=45)  # 设置X轴标签旋转角度
+        plt.xlabel(self.x_field)
+        if ylabel:
+            plt.ylabel(ylabel)
+        if title:
+            plt.title(title)
         plt.grid(True)
         plt.tight_layout()  # 调整整体空白
-        plt.show()
-
-
-    def handle_anomaly_lof(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        selected_column = self.list_widget2.item(0).text()  # 获取选中的列名
-        data1 = pd.read_excel(path_rawdata)
-
-        # 创建新列名，表示这是处理后的数据
-        new_column_name = selected_column + '_LOF异常值处理'
-
-        # LOF算法需要一个二维数组作为输入，因此将选中的列转换为二维数组
-        X = data1[[selected_column]].values
-
-        # 初始化LOF检测器
-        lof = LocalOutlierFactor(n_neighbors=20, novelty=False, contamination='auto')
-        y_pred = lof.fit_predict(X)
 
-        # 复制原始列的数据到新列
-        data1[new_column_name] = data1[selected_column].copy()
-
-        # 标记被LOF算法识别为异常的值
-        # LOF返回-1表示异常值，1表示正常值
-        data1.loc[y_pred == -1, new_column_name] = np.nan  # 将异常值替换为NaN
+    def ZSCORE(self):
+        # 计算 z-score 标准化，派生列名为 列名_z-score标准化
+        self.run_operation('zscore')
 
-        # 将DataFrame保存回原始文件，这样原始数据列保持不变，只是新增了处理后的列
-        data1.to_excel(path_rawdata, index=False)
+    def tab1(self):
+        self.run_operation('minmax')
 
-        # 绘图部分，对比原始数据和异常值处理后的数据
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-        plt.figure(figsize=(10, 6))  # 设置图形大小
-        plt.plot(x_ticks, data1[selected_column].tolist(), marker='o', linestyle='-', label='原始数据')
-        plt.plot(x_ticks, data1[new_column_name].tolist(), marker='x', linestyle='--', label='LOF异常值处理后')
-        plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.ylabel('值')
-        plt.title('LOF异常值处理前后对比')
-        plt.grid(True)
-        plt.tight_layout()  # 调整整体空白
-        plt.show()
+    def tab2(self):
+        # 0和NaN视为缺失值，用前后4个有效值的均值填充
+        self.run_operation('impute', dict(window=4), compare=True, title='缺失值处理前后对比', ylabel='值')
 
+    def handle_anomaly_lof(self):
+        # LOF检测出的异常值替换为NaN
+        contamination = self.lof_contamination_combox.currentText().strip()
+        if contamination != 'auto':
+            try:
+                contamination = float(contamination)
+            except ValueError:
+                contamination = -1
+            if not 0 < contamination <= 0.5:
+                QtWidgets.QMessageBox.information(
+                    self, '提示', '异常比例应为 auto 或 0~0.5 之间的小数', QtWidgets.QMessageBox.Yes)
+                return
+        params = dict(n_neighbors=self.lof_neighbors_spin.value(), contamination=contamination,
+                      window=self.lof_window_spin.value())
+        self.run_operation('lof', params, compare=True, highlight=True, title='LOF异常值处理前后对比', ylabel='值')
+
+    def handle_anomaly_online(self):
+        # 滑动窗口 z-score 检测，规则与实时数据流的在线检测相同
+        params = dict(window=self.online_window_spin.value(), threshold=self.online_threshold_spin.value())
+        self.run_operation('online', params, compare=True, highlight=True, title='在线异常值检测前后对比', ylabel='值')
 
     def tab4_1(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        content00 = self.list_widget2.item(0).text()
-        content00 = str(content00)
-        data1 = pd.read_excel(path_rawdata)
-
-        window_size = 3  # 移动窗口大小
-
-        # 新列名，加上content00的值作为前缀
-        new_column_name = content00 + '_移动平均滤波'
-        data1[new_column_name] = data1[content00].rolling(window=window_size).mean()
-
-        # 将更改保存回原始文件
-        data1.to_excel(path_rawdata, index=False)
-
-        # 绘图部分
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-
-        plt.plot(x_ticks, data1[new_column_name].tolist(), marker='o', label='移动平均滤波')
-        plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.grid(True)
-        plt.show()
+        window_size = self.window_spin.value()  # 移动窗口大小
+        self.run_operation('moving_average', dict(window=window_size))
 
     def tab4_2(self):
-        root = tkinter.Tk()
-        root.withdraw()
-        path_rawdata = self.file_name_label.text()  # 读取原始数据文件路径
-        content00 = self.list_widget2.item(0).text()
-        content00 = str(content00)
-        data1 = pd.read_excel(path_rawdata)
-
-        alpha = 0.2  # 平滑参数
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-
-        # 新列名，加上content00的值作为前缀
-        new_column_name = content00 + '_均值滤波'
-        data1[new_column_name] = data1[content00].ewm(alpha=alpha).mean()
+        alpha = self.alpha_spin.value()  # 平滑参数
+        self.run_operation('ewm', dict(alpha=alpha))
 
-        # 将更改保存回原始文件
-        data1.to_excel(path_rawdata, index=False)
-
-        x_labels = data1['日期'].astype(str)  # 将日期转换为字符串以用作标签
-        x_ticks = range(len(x_labels))  # 创建一个用于标记的索引范围
-
-        plt.plot(x_ticks, data1[new_column_name].tolist(), marker='o', label='均值滤波')
-        plt.legend()
-        plt.xticks(x_ticks, x_labels, rotation=45)  # 设置X轴标签和旋转角度
-        plt.xlabel('日期')
-        plt.grid(True)
-        plt.show()
+    def pipeline_btn_clicked(self):
+        if self.job is not None:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '上一个处理还没有完成', QtWidgets.QMessageBox.Yes)
+            return
+        try:
+            steps = parse_pipeline(self.pipeline_lineedit.text())
+        except ValueError as e:
+            QtWidgets.QMessageBox.information(self, '提示', str(e), QtWidgets.QMessageBox.Yes)
+            return
+        if not steps or not self.selected_columns():
+            return
+        self.pipeline_steps = steps
+        self.run_pipeline_step(self.selected_columns())
+
+    def run_pipeline_step(self, columns: list):
+        op, params = self.pipeline_steps.pop(0)
+        if op == 'rate':
+            params = dict(params, timestamp=self.dataset.timestamps(self.x_field))
+        elif op == 'change':
+            params = dict(params, **operation_context(op, self.dataset.frame(), self.x_field))
+        plot_kwargs = {} if self.pipeline_steps else dict(title='处理链结果')
+        self.run_operation(op, params, columns, **plot_kwargs)
 
     def tab5_1(self):
-        path_rawdata = self.file_name_label.text()
-        print(path_rawdata)
-        data = pd.read_excel(path_rawdata, header=None)
+        # 相邻两天首条记录的差异
+        params = operation_context('change', self.dataset.frame(), self.x_field)
+        self.run_operation('change', params, sparse=True, title='每日数据差异', ylabel='变化值(克/日)')
 
-        data.columns = data.iloc[0]
-        data = data.iloc[1:]
-        m = self.body_combox.itemText(self.body_combox.currentIndex())
-        print(m)  # 重力1
-
-        df_first = data.drop_duplicates(subset=['日期'], keep='first')
-        print(df_first)
-
-        # 3. 计算相邻两天的数据差异
-        content00 = m  # 假设content00为m的值
-        new_column_name = content00 + '_变化值'
-        df_subset = df_first.copy()
-        df_subset[new_column_name] = df_subset[m].diff()  # 使用带前缀的列名
+    def tab5_2(self):
+        # 相邻时间段首条记录的差异换算成每小时的变化量；时间戳用缓存的时间索引
+        params = dict(timestamp=self.dataset.timestamps(self.x_field),
+                      interval=RATE_INTERVALS[self.rate_interval_combox.currentText()])
+        self.run_operation('rate', params, sparse=True, ylabel='蒸腾速率(g/h)')
 
-        df_subset.to_excel(path_rawdata, index=False)
+    def tab5_3(self):
+        # 前两列分别作为公式中的 m1、m2；输入框里每行一个时间段，如 2022-09-14 20 2022-09-14 21，
+        # 留空时计算每两个相邻时间段。计算在后台线程进行
+        if self.job is not None:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '上一个处理还没有完成', QtWidgets.QMessageBox.Yes)
+            return
+        columns = self.selected_columns()
+        if len(columns) != 2:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '请选择两列表头（m1、m2）', QtWidgets.QMessageBox.Yes)
+            return
+        m1, m2 = columns
+        pairs = []
+        invalid = []
+        for line in self.gsc_pairs_edit.toPlainText().splitlines():
+            if not line.strip():
+                continue
+            # 只有小时的时间补上分钟，如 2022-09-14 20 -> 2022-09-14 20:00
+            times = [t + ':00' if re.search(r'[ T]\d{1,2}$', t) else t for t in TIME_PATTERN.findall(line)]
+            if len(times) == 2:
+                pairs.append(times)
+            else:
+                invalid.append(line.strip())
+        # 有无法识别的行时不计算，不能悄悄跳过或改成计算相邻时间段
+        if invalid:
+            QtWidgets.QMessageBox.information(
+                self, '提示', '以下时间段无法识别，每行应为开始、结束两个时间：\n' + '\n'.join(invalid),
+                QtWidgets.QMessageBox.Yes)
+            return
+        params = dict(timestamp=self.dataset.timestamps(self.x_field),
+                      interval=RATE_INTERVALS[self.rate_interval_combox.currentText()], pairs=pairs)
+        values = np.column_stack([self.dataset.column(m1), self.dataset.column(m2)])
+        name = m1 + '_气孔导度'
+
+        def finished(gsc):
+            self.job_done()
+            self.dataset.add_derived(name, gsc[:, 0])
+            self.update_field_combox()
+            self.plot_results([m1], [name], gsc, sparse=True, ylabel='气孔导度')
+
+        self.start_job(stomatal_conductance, values, params, finished)
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    # 诊断面板：各阶段耗时记录、内存峰值开关、采集所选阶段下一次运行的 cProfile
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('诊断')
+        self.resize(900, 500)
+        self.table = QtWidgets.QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(['时间', '阶段', '详情', '行数', '耗时(s)', '内存峰值(MB)'])
+        self.table.horizontalHeader().setSectionResizeMode(2, QtWidgets.QHeaderView.Stretch)
+        self.memory_checkbox = QtWidgets.QCheckBox('记录内存峰值（会变慢）')
+        self.memory_checkbox.setChecked(tracemalloc.is_tracing())
+        self.memory_checkbox.toggled.connect(StageRecorder.set_trace_memory)
+        self.stage_combox = QtWidgets.QComboBox()
+        self.stage_combox.addItems(StageRecorder.names)
+        self.stage_combox.setCurrentText('compute')
+        profile_btn = QtWidgets.QPushButton('采集该阶段下一次运行的性能分析')
+        profile_btn.clicked.connect(self.profile_btn_clicked)
+        self.info_label = QtWidgets.QLabel()
+        self.info_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
 
-        plt.plot(df_subset['日期'], df_subset[new_column_name], marker='o', label='变化值')
-        plt.legend()
-        plt.xlabel('日期')
-        plt.ylabel('变化值(克/日)')
-        plt.title('每日数据差异')
-        plt.grid(True)
-        plt.show()
+        layout_top = QtWidgets.QHBoxLayout()
+        layout_top.addWidget(self.memory_checkbox)
+        layout_top.addWidget(self.stage_combox)
+        layout_top.addWidget(profile_btn)
+        layout_top.addStretch(1)
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(layout_top)
+        layout.addWidget(self.table)
+        layout.addWidget(self.info_label)
+        self.setLayout(layout)
 
-    def tab5_2(self):
-        path_rawdata = self.file_name_label.text()
-        print(path_rawdata)
-        data = pd.read_excel(path_rawdata, header=None)
-        data.columns = data.iloc[0]
-        data = data.iloc[1:]
-        m = self.body_combox.itemText(self.body_combox.currentIndex())
-
-        # 创建时间戳列
-        data['timestamp'] = pd.to_datetime(data['日期'].astype(str) + ' ' + data['时间'].astype(str))
-        data.sort_values(by='timestamp', inplace=True)
-
-        # 选择每个小时的第一条记录
-        data['hour'] = data['timestamp'].dt.floor('H')
-        df_first = data.drop_duplicates(subset=['hour'], keep='first')
-
-        # 获取content00的值作为列名前缀
-        content00 = self.textEdit.toPlainText()
-        new_column_name = content00 + '_蒸腾速率'
-
-        # 计算相邻小时内数据的差异
-        df_first[new_column_name] = df_first[m].diff()
-
-        df_first.to_excel(path_rawdata, index=False)
-
-        plt.plot(df_first['hour'], df_first[new_column_name], marker='o')
-        hour_labels = df_first['hour'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
-        plt.xticks(df_first['hour'], hour_labels, rotation=45)
-        plt.xlabel('Hour')
-        plt.ylabel('蒸腾速率(g/h)')
-        plt.grid(True)
-        plt.show()
+    def profile_btn_clicked(self):
+        STAGES.profile_stage = self.stage_combox.currentText()
+        self.refresh()
+
+    def refresh(self):
+        records = list(STAGES.records)[::-1]
+        self.table.setRowCount(len(records))
+        for i, record in enumerate(records):
+            peak = record.get('peak_mb')
+            cells = [record['time'], record['stage'], StageRecorder.details(record), str(record['rows']),
+                     f"{record['seconds']:.3f}", '' if peak is None else f'{peak:.1f}']
+            for j, text in enumerate(cells):
+                self.table.setItem(i, j, QtWidgets.QTableWidgetItem(text))
+        lines = [f'日志：{STAGES.log_path or "未启用"}']
+        if STAGES.profile_stage:
+            lines.append(f'{STAGES.profile_stage} 阶段下一次运行时将采集性能分析')
+        if STAGES.profile_stage or STAGES.last_profile:
+            lines.append('性能分析只包含阶段所在的线程和它交给计算线程池的调用（如多列 LOF），不包含同时运行的其他后台任务')
+        if STAGES.last_profile:
+            lines.append(f'性能分析结果：{STAGES.last_profile}')
+        self.info_label.setText('\n'.join(lines))
 
-    def tab5_3(self):
-        path_rawdata = self.file_name_label.text()
-        print(path_rawdata)
-        data = pd.read_excel(path_rawdata, header=None)
-
-        data.columns = data.iloc[0]
-        data = data.iloc[1:]
-        m1 = self.body_combox.itemText(self.body_combox.currentIndex())
-        m2 = self.comboBox_2.itemText(self.comboBox_2.currentIndex())
-
-        # 2022-09-14 20 2022-09-14 21
-        now = []
-        for i in range(data.shape[0]):
-            now.append(str(data['日期'].tolist()[i])[0:10] + ' ' + str(data['时间'].tolist()[i])[0:2])
-        data['time'] = now
-        data_time = data['time'].tolist()
-        content00 = self.textEdit.toPlainText()
-        content01 = str(content00)[0:13]
-        content02 = str(content00)[14:27]
-        index_one = data_time.index(content01)
-        index_two = data_time.index(content02)
-
-        date_format = '%Y-%m-%d %H'
-        date1 = datetime.strptime(content01, date_format)
-        date2 = datetime.strptime(content02, date_format)
-        time_difference = date2 - date1
-        hours_difference = time_difference.total_seconds() / 3600
-
-        # 公式
-        E = hours_difference * (data[m1].tolist()[index_two] - data[m1].tolist()[index_one]) / (
-                data[m2].tolist()[index_two] - data[m2].tolist()[index_one])
-        gsc = E * 101.3 / (0.610788 * math.e ** (
-                17.27 * data[m1].tolist()[index_two] / (data[m1].tolist()[index_two] + 237.3)) * (
-                                   1 - data[m1].tolist()[index_one]))
-        print('气孔导度：', gsc)
 
 class LoginDialog(QtWidgets.QDialog):
     def __init__(self):
@@ -966,10 +3177,38 @@ class LoginDialog(QtWidgets.QDialog):
             self.accept()
         else:
             QtWidgets.QMessageBox.warning(self, "错误", "用户名或密码不正确！")
+def startup_benchmark(app: QtWidgets.QApplication) -> dict:
+    # 启动耗时：从进程启动（由基准脚本通过环境变量传入，否则为本模块开始导入）
+    # 到登录框显示、主窗口显示；登录框自动通过
+    t0 = float(os.environ.get('ANALYSIS_STARTUP_T0', _MODULE_T0))
+    result = {'import_s': _MODULE_LOADED - t0}
+    login_dialog = LoginDialog()
+    login_dialog.show()
+    app.processEvents()
+    result['login_dialog_s'] = time.time() - t0
+    login_dialog.accept()
+    main_window = LineMainWidget()
+    main_window.showMaximized()
+    app.processEvents()
+    result['main_window_s'] = time.time() - t0
+    result['heavy_modules_loaded'] = [m for m in ('sklearn', 'matplotlib', 'tkinter') if m in sys.modules]
+    main_window.close()
+    return result
+
+
+_MODULE_LOADED = time.time()
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
     QtCore.QCoreApplication.setAttribute(QtCore.Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
     app = QtWidgets.QApplication(sys.argv)
+    if '--startup-bench' in sys.argv:
+        print(json.dumps(startup_benchmark(app)))
+        sys.exit()
 
+    STAGES.set_log_path(os.path.join(os.environ.get(
+        'ANALYSIS_LOG_DIR', os.path.join(os.path.expanduser('~'), '.analysis_supervise', 'logs')), 'stages.jsonl'))
     login_dialog = LoginDialog()
     if login_dialog.exec_() == QtWidgets.QDialog.Accepted:
         main_window = LineMainWidget()
@@ -0,0 +1,40 @@
+"""启动耗时基准：多次冷启动 analysis.py，统计到登录框、到主窗口的耗时。
+
+    python benchmarks/bench_startup.py --runs 5 --out startup.json
+"""
+import os, sys, json, time, argparse, statistics, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # 把启动前的时间传给子进程，结果里包含解释器启动和模块导入
+    env['ANALYSIS_STARTUP_T0'] = repr(time.time())
+    out = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'analysis.py'), '--startup-bench'],
+        env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='analysis.py 启动耗时基准')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--out', default='', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = {}
+    for key in ('import_s', 'login_dialog_s', 'main_window_s'):
+        values = [r[key] for r in runs]
+        summary[key] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+        print(f"{key:>16}: median {summary[key]['median']:.3f}s  min {summary[key]['min']:.3f}s  max {summary[key]['max']:.3f}s")
+    print(f"heavy modules loaded at startup: {runs[-1]['heavy_modules_loaded']}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
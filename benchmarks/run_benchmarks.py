@@ -0,0 +1,164 @@
+"""处理性能基准：在生成的记录仪数据上计时文件打开、横坐标解析、各处理操作和绘图数据更新。
+
+    python benchmarks/run_benchmarks.py --sizes 10000x1,100000x5,1000000x10 --out bench.json
+    python benchmarks/run_benchmarks.py --sizes 10000x1 --compare bench.json
+
+数据按 行数x列数 生成（固定随机种子，含缺失、0 值和尖峰），缓存在 --data-dir 中重复使用。
+结果写成 JSON，--compare 与之前（如另一个提交）的结果逐项对比。
+"""
+import os, sys, json, time, argparse, platform, statistics, subprocess
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+import analysis
+
+
+def generate(path: str, rows: int, cols: int, seed: int = 0):
+    # 模拟称重记录仪：每分钟一条，重量缓慢下降并带日变化，随机出现缺失、0 值和尖峰
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range('2022-09-14', periods=rows, freq='min')
+    df = pd.DataFrame({'日期': ts.strftime('%Y-%m-%d'), '时间': ts.strftime('%H:%M:%S')})
+    t = np.arange(rows)
+    for k in range(cols):
+        y = 5000 + 300 * k - 0.01 * t + 20 * np.sin(2 * np.pi * t / 1440) + rng.normal(0, 0.5, rows)
+        y[rng.random(rows) < 0.01] = np.nan
+        y[rng.random(rows) < 0.005] = 0
+        spikes = rng.random(rows) < 0.001
+        y[spikes] += rng.normal(0, 500, spikes.sum())
+        df[f'重力{k + 1}'] = np.round(y, 2)
+    df.to_csv(path, index=False, encoding='utf-8')
+
+
+def dataset_path(data_dir: str, rows: int, cols: int) -> str:
+    path = os.path.join(data_dir, f'logger_{rows}x{cols}.csv')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        generate(path, rows, cols)
+    return path
+
+
+def timed(func, repeat: int) -> list:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def bench_dataset(path: str, ops: list, repeat: int, app) -> dict:
+    results = {}
+    dataset = analysis.SessionDataset()
+    dataset.file_cache = None
+    dataset.keep_columns = analysis.TIME_COLUMNS
+    results['open'] = timed(lambda: dataset.load(path), repeat)
+    df = dataset.frame()
+    results['parse_x'] = timed(lambda: analysis.parse_time_index(df['日期']), repeat)
+    results['parse_timestamp'] = timed(lambda: analysis.frame_timestamp(df, '日期'), repeat)
+
+    columns = [col for col in df.columns if col not in analysis.TIME_COLUMNS]
+    values = df[columns].to_numpy(dtype=np.float64)
+    defaults = {'rate': {'timestamp': analysis.frame_timestamp(df, '日期')},
+                'change': analysis.operation_context('change', df, '日期')}
+    for op in ops:
+        func = analysis.OPERATIONS[op][1]
+        params = defaults.get(op, {})
+        results[f'op_{op}'] = timed(lambda: func(values, **params), repeat)
+
+    # 绘图：首次设置数据、替换数据、缩放到 1/10 后按可见范围抽稀
+    widget = analysis.GraphWidget()
+    widget.resize(1600, 900)
+    widget.show()
+    labels = np.datetime_as_string(analysis.parse_time_index(df['日期']), unit='D')
+    line_data = {
+        'xTick': labels,
+        'x': np.arange(len(df), dtype=np.float64),
+        'y_list': [np.ascontiguousarray(values[:, k]) for k in range(min(len(columns), 20))],
+        'y_names': columns[:20],
+    }
+
+    def first_plot():
+        widget.set_empty()
+        widget.first_setData(line_data)
+        app.processEvents()
+
+    def update_plot():
+        widget.set_data(line_data)
+        app.processEvents()
+
+    def zoom():
+        widget.apply_range(0, max(len(df) // 10, 1))
+        widget.update_decimation()
+        app.processEvents()
+
+    results['plot_first'] = timed(first_plot, repeat)
+    results['plot_update'] = timed(update_plot, repeat)
+    results['plot_zoom'] = timed(zoom, repeat)
+    widget.close()
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def compare(results: list, base_path: str):
+    with open(base_path, encoding='utf-8') as f:
+        base = {(r['dataset'], r['stage']): r['median_s'] for r in json.load(f)['results']}
+    print(f"{'dataset':>14} {'stage':>20} {'base':>10} {'now':>10} {'ratio':>7}")
+    for r in results:
+        old = base.get((r['dataset'], r['stage']))
+        if old is None:
+            continue
+        print(f"{r['dataset']:>14} {r['stage']:>20} {old:10.4f} {r['median_s']:10.4f} {r['median_s'] / old:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='analysis.py 处理性能基准')
+    parser.add_argument('--sizes', default='10000x1,100000x5,1000000x10',
+                        help='数据规模，逗号分隔的 行数x列数，如 10000x1,10000000x50')
+    parser.add_argument('--ops', default=','.join(analysis.OPERATIONS), help='要计时的处理操作')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'benchmarks', 'data'))
+    parser.add_argument('--out', default='', help='结果写入的 JSON 文件')
+    parser.add_argument('--compare', default='', help='与之前保存的 JSON 结果对比')
+    args = parser.parse_args()
+
+    app = analysis.QtWidgets.QApplication.instance() or analysis.QtWidgets.QApplication([])
+    ops = [op for op in args.ops.split(',') if op]
+    results = []
+    for size in args.sizes.split(','):
+        rows, cols = (int(v) for v in size.lower().split('x'))
+        path = dataset_path(args.data_dir, rows, cols)
+        for stage, runs in bench_dataset(path, ops, args.repeat, app).items():
+            r = {'dataset': f'{rows}x{cols}', 'stage': stage, 'median_s': statistics.median(runs),
+                 'min_s': min(runs), 'runs': runs}
+            results.append(r)
+            print(f"{r['dataset']:>14} {stage:>20}: median {r['median_s']:.4f}s  min {r['min_s']:.4f}s", flush=True)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()